@@ -0,0 +1,204 @@
+import os
+import sys
+import sqlite3
+import tempfile
+import threading
+from datetime import datetime, timedelta
+from esquema import COLUMNAS_FMM, COLUMNAS_GUIA, ESTADO_OK
+
+# Histórico local de guías y formularios en SQLite para conciliar entre días: una guía de
+# lunes puede llegar en un formulario del miércoles. Las guías se indexan por Tracking y los
+# formularios por (Tracking, FMM_Formulario); los trackings conciliados se marcan cerrados y
+# se depuran pasado el periodo de retención. pandas y el motor de conciliación se importan al
+# consultar o conciliar, no al abrir el histórico (la app muestra sus estadísticas al arrancar).
+RUTA_POR_DEFECTO = os.environ.get(
+    "CONCILIACION_ALMACEN", os.path.join(tempfile.gettempdir(), "conciliacion_trackings.sqlite")
+)
+RETENCION_DIAS_POR_DEFECTO = int(os.environ.get("CONCILIACION_RETENCION_DIAS", "90"))
+
+_ESQUEMA = """
+CREATE TABLE IF NOT EXISTS guias (
+    {guias},
+    cargado_en TEXT NOT NULL,
+    cerrado INTEGER NOT NULL DEFAULT 0,
+    cerrado_en TEXT,
+    PRIMARY KEY (Tracking)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS formularios (
+    {formularios},
+    cargado_en TEXT NOT NULL,
+    cerrado INTEGER NOT NULL DEFAULT 0,
+    cerrado_en TEXT,
+    PRIMARY KEY (Tracking, FMM_Formulario)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS guias_abiertas ON guias (Fecha_Guia) WHERE cerrado = 0;
+CREATE INDEX IF NOT EXISTS guias_cerradas ON guias (cerrado_en) WHERE cerrado = 1;
+CREATE INDEX IF NOT EXISTS formularios_abiertos ON formularios (Fecha_FMM) WHERE cerrado = 0;
+CREATE INDEX IF NOT EXISTS formularios_cerrados ON formularios (cerrado_en) WHERE cerrado = 1;
+""".format(
+    guias=",\n    ".join(f"{col} TEXT NOT NULL DEFAULT ''" for col in COLUMNAS_GUIA),
+    formularios=",\n    ".join(f"{col} TEXT NOT NULL DEFAULT ''" for col in COLUMNAS_FMM),
+)
+
+# Tamaño de los lotes de parámetros en las consultas IN (límite de variables de SQLite)
+_LOTE_PARAMETROS = 500
+
+def _upsert(tabla, columnas, clave):
+    # Un registro nuevo de un tracking ya cerrado lo reabre para volver a conciliarlo
+    actualizar = ", ".join(f"{col} = excluded.{col}" for col in columnas if col not in clave)
+    return (
+        f"INSERT INTO {tabla} ({', '.join(columnas)}, cargado_en) VALUES ({', '.join('?' * (len(columnas) + 1))}) "
+        f"ON CONFLICT ({', '.join(clave)}) DO UPDATE SET {actualizar}, cargado_en = excluded.cargado_en, "
+        f"cerrado = 0, cerrado_en = NULL"
+    )
+
+_UPSERT_GUIAS = _upsert("guias", COLUMNAS_GUIA, ("Tracking",))
+_UPSERT_FORMULARIOS = _upsert("formularios", COLUMNAS_FMM, ("Tracking", "FMM_Formulario"))
+
+def _filas(registros, columnas, ahora):
+    return [tuple(str(registro.get(col) or "") for col in columnas) + (ahora,) for registro in registros]
+
+def _como_registros(registros):
+    # Un DataFrame (tipado) se pasa a registros de texto; si pandas no está cargado no puede serlo
+    pd = sys.modules.get("pandas")
+    if pd is not None and isinstance(registros, pd.DataFrame):
+        from registros import a_registros
+        return a_registros(registros)
+    return registros
+
+def _ahora():
+    return datetime.now().isoformat(timespec="seconds")
+
+class AlmacenTrackings:
+    def __init__(self, ruta=RUTA_POR_DEFECTO):
+        self.ruta = ruta
+        self._lock = threading.Lock()
+        directorio = os.path.dirname(os.path.abspath(ruta))
+        os.makedirs(directorio, exist_ok=True)
+        # Una conexión compartida por los hilos de Streamlit, serializada con el lock
+        self._conexion = sqlite3.connect(ruta, check_same_thread=False)
+        self._conexion.execute("PRAGMA journal_mode=WAL")
+        self._conexion.execute("PRAGMA synchronous=NORMAL")
+        self._conexion.executescript(_ESQUEMA)
+        # Escrituras de esta conexión; las de otras conexiones se detectan con PRAGMA data_version
+        self._escrituras = 0
+        self._estadisticas = None
+
+    def cerrar_conexion(self):
+        with self._lock:
+            self._conexion.close()
+
+    # --- CARGA ---
+    def guardar(self, registros_guias=(), registros_formularios=()):
+        # Inserta o actualiza los registros tal como salen de la extracción (dicts o DataFrame)
+        registros_guias, registros_formularios = _como_registros(registros_guias), _como_registros(registros_formularios)
+        ahora = _ahora()
+        # Igual que en la conciliación de la sesión, la primera guía de cada tracking gana
+        filas_guias = list({fila[0]: fila for fila in reversed(_filas(registros_guias, COLUMNAS_GUIA, ahora))}.values())
+        filas_formularios = _filas(registros_formularios, COLUMNAS_FMM, ahora)
+        with self._lock, self._conexion:
+            self._conexion.executemany(_UPSERT_GUIAS, filas_guias)
+            self._conexion.executemany(_UPSERT_FORMULARIOS, filas_formularios)
+            self._escrituras += 1
+        return len(filas_guias), len(filas_formularios)
+
+    # --- CONSULTAS ---
+    def _consultar(self, sql, parametros=()):
+        import pandas as pd
+        with self._lock:
+            cursor = self._conexion.execute(sql, parametros)
+            columnas = [d[0] for d in cursor.description]
+            return pd.DataFrame(cursor.fetchall(), columns=columnas)
+
+    def buscar(self, trackings):
+        # Guías y formularios (abiertos o cerrados) de los trackings indicados
+        import pandas as pd
+        trackings = list(dict.fromkeys(trackings))
+        if not trackings:
+            return self._consultar("SELECT * FROM guias LIMIT 0"), self._consultar("SELECT * FROM formularios LIMIT 0")
+        partes_guias, partes_formularios = [], []
+        for i in range(0, len(trackings), _LOTE_PARAMETROS):
+            lote = trackings[i:i + _LOTE_PARAMETROS]
+            marcas = ", ".join("?" * len(lote))
+            partes_guias.append(self._consultar(f"SELECT * FROM guias WHERE Tracking IN ({marcas})", lote))
+            partes_formularios.append(self._consultar(f"SELECT * FROM formularios WHERE Tracking IN ({marcas})", lote))
+        return pd.concat(partes_guias, ignore_index=True), pd.concat(partes_formularios, ignore_index=True)
+
+    def ventana(self, desde=None, hasta=None):
+        # Trackings con algún registro abierto en el rango de fechas (ISO, inclusivo) junto con
+        # todos sus registros, para que la contraparte de otro día no aparezca como huérfana.
+        # Sin rango entran todos los abiertos, también los que no tienen fecha.
+        condiciones_guias, condiciones_formularios = ["cerrado = 0"], ["cerrado = 0"]
+        if desde:
+            condiciones_guias.append("Fecha_Guia >= ?")
+            condiciones_formularios.append("Fecha_FMM >= ?")
+        if hasta:
+            condiciones_guias.append("Fecha_Guia <= ?")
+            condiciones_formularios.append("Fecha_FMM <= ?")
+        rango = [str(f) for f in (desde, hasta) if f]
+        parametros = rango + rango
+        abiertos = (
+            f"SELECT Tracking FROM guias WHERE {' AND '.join(condiciones_guias)} "
+            f"UNION SELECT Tracking FROM formularios WHERE {' AND '.join(condiciones_formularios)}"
+        )
+        df_guias = self._consultar(
+            f"WITH ventana AS ({abiertos}) SELECT {', '.join(COLUMNAS_GUIA)} FROM guias JOIN ventana USING (Tracking) "
+            f"ORDER BY Tracking", parametros
+        )
+        df_formularios = self._consultar(
+            f"WITH ventana AS ({abiertos}) SELECT {', '.join(COLUMNAS_FMM)} FROM formularios JOIN ventana USING (Tracking) "
+            f"ORDER BY Tracking, cargado_en", parametros
+        )
+        from registros import tipar
+        return tipar(df_guias), tipar(df_formularios)
+
+    def conciliar_ventana(self, desde=None, hasta=None):
+        from conciliacion import conciliar
+        df_guias, df_formularios = self.ventana(desde, hasta)
+        if df_guias.empty and df_formularios.empty: return None
+        return conciliar(df_guias, df_formularios)
+
+    # --- CIERRE Y RETENCIÓN ---
+    def cerrar(self, df_conciliado):
+        # Cierra los trackings cuyas filas están todas OK; devuelve cuántos se cerraron
+        estados_ok = df_conciliado['Estado_Conciliacion'].eq(ESTADO_OK).groupby(df_conciliado['Tracking']).all()
+        trackings = estados_ok.index[estados_ok].tolist()
+        ahora = _ahora()
+        with self._lock, self._conexion:
+            for i in range(0, len(trackings), _LOTE_PARAMETROS):
+                lote = trackings[i:i + _LOTE_PARAMETROS]
+                marcas = ", ".join("?" * len(lote))
+                for tabla in ("guias", "formularios"):
+                    self._conexion.execute(
+                        f"UPDATE {tabla} SET cerrado = 1, cerrado_en = ? WHERE cerrado = 0 AND Tracking IN ({marcas})",
+                        [ahora] + lote
+                    )
+            self._escrituras += 1
+        return len(trackings)
+
+    def depurar(self, dias_retencion=RETENCION_DIAS_POR_DEFECTO):
+        # Elimina los registros cerrados hace más de `dias_retencion` días
+        limite = (datetime.now() - timedelta(days=dias_retencion)).isoformat(timespec="seconds")
+        with self._lock, self._conexion:
+            eliminados = sum(
+                self._conexion.execute(f"DELETE FROM {tabla} WHERE cerrado = 1 AND cerrado_en < ?", (limite,)).rowcount
+                for tabla in ("guias", "formularios")
+            )
+            self._escrituras += 1
+        return eliminados
+
+    def estadisticas(self):
+        # Los conteos recorren las tablas completas: se reutilizan mientras nadie escriba en el histórico
+        with self._lock:
+            version = (self._escrituras, self._conexion.execute("PRAGMA data_version").fetchone()[0])
+            if self._estadisticas is None or self._estadisticas[0] != version:
+                consulta = "SELECT COUNT(*), COALESCE(SUM(cerrado = 0), 0) FROM {}"
+                guias, guias_abiertas = self._conexion.execute(consulta.format("guias")).fetchone()
+                formularios, formularios_abiertos = self._conexion.execute(consulta.format("formularios")).fetchone()
+                self._estadisticas = (version, {
+                    "guias": guias,
+                    "guias_abiertas": guias_abiertas,
+                    "formularios": formularios,
+                    "formularios_abiertos": formularios_abiertos,
+                })
+            return dict(self._estadisticas[1])
@@ -1,517 +1,480 @@
-import os
-import re
-import streamlit as st
-import pandas as pd
-import pdfplumber
-from datetime import datetime
-import tempfile
-import io
-
-# --- CONFIGURACIÓN INICIAL ---
-st.set_page_config(page_title="Sistema de Conciliación de Guías", page_icon="📦", layout="wide")
-
-# --- FUNCIONES PRINCIPALES COMPLETAS ---
-def pdf_detectar_operador(texto_guia):
-    texto_upper = texto_guia.upper()
-    if "FEDEX" in texto_upper or "TRK" in texto_upper or "MPS#" in texto_upper: return "FedEx"
-    if "EXPRESS WORLDWIDE" in texto_upper or "WAYBILL" in texto_upper: return "DHL"
-    if "UPS WORLDWIDE SERVICE" in texto_upper or "COJE" in texto_upper: return "UPS"
-    return "Desconocido"
-
-def pdf_extraer_tracking(texto_guia, operador):
-    if operador == "FedEx":
-        posibles = re.findall(r"\b(?:\d{4}\s\d{4}\s\d{4}|\d{12})\b", texto_guia)
-        if len(posibles) == 1: return posibles[0].replace(" ", "")
-        if len(posibles) > 1:
-            match_master = re.search(r"Mstr#\s*(\d{4}\s\d{4}\s\d{4}|\d{12})", texto_guia)
-            master = match_master.group(1).replace(" ", "") if match_master else None
-            for track in posibles:
-                if track.replace(" ", "") != master: return track.replace(" ", "")
-            return posibles[0].replace(" ", "")
-    elif operador == "DHL":
-        m = re.search(r"WAYBILL\s+([\d\s]{10,})", texto_guia)
-        return re.sub(r"\s+", "", m.group(1)) if m else ""
-    elif operador == "UPS":
-        m = re.search(r"SERVICE\s+(COJE[A-Z0-9]+)", texto_guia)
-        return m.group(1) if m else ""
-    return ""
-
-def pdf_extraer_pais_destino(texto_guia):
-    if "UNITED STATES OF AMERICA" in texto_guia: return "UNITED STATES OF AMERICA"
-    m_codigo = re.search(r"\(([A-Z]{2})\)", texto_guia)
-    if m_codigo: return m_codigo.group(1)
-    return ""
-
-def pdf_extraer_facturas(texto_guia, operador, ref_no_maestro_dhl):
-    facturas_inv = re.findall(r"INV[:\s]*([A-Z0-9]+)", texto_guia)
-    facturas_zffe = re.findall(r"\b(ZFFE\d+|ZFFV\d+)\b", texto_guia)
-    todas = set(facturas_inv + facturas_zffe)
-    if operador == "DHL" and ref_no_maestro_dhl:
-        todas.add(ref_no_maestro_dhl)
-    return ", ".join(sorted(list(todas))) if todas else ""
-
-def pdf_extraer_remitente(texto_guia):
-    m = re.search(r"(SOLIDEO\s*S\.?A?\.?S\.?)", texto_guia, re.IGNORECASE)
-    if m: return "SOLIDEO S.A.S."
-    return ""
-
-def pdf_extraer_peso_neto(texto_guia, operador):
-    texto_guia_upper = texto_guia.upper()
-    match_pn = re.search(r"PN[:\s]*([\d.,]+)", texto_guia_upper)
-    if match_pn:
-        peso = match_pn.group(1).replace(",", ".")
-        try: return f"{float(peso):.2f}"
-        except: return peso
-    return ""
-
-def pdf_extraer_fmm_guia(texto_guia, operador):
-    patrones = [r"FMM[:\s]*(\d+)", r"FMM\s*No\.?\s*(\d+)", r"F\.M\.M\.\s*(\d+)", r"\b(\d{6})\b(?=.*FMM)"]
-    for patrones in patrones:
-        match = re.search(patrones, texto_guia, re.IGNORECASE)
-        if match: return match.group(1)
-    return ""
-
-def pdf_extraer_fecha_ups(texto_guia):
-    patrones = [r"Date\s+(\d{1,2}\s+[A-Z]{3}\s+\d{4})", r"UPS WORLDWIDE SERVICE.*?Date\s+(\d{1,2}\s+[A-Z]{3}\s+\d{4})"]
-    for patron in patrones:
-        match = re.search(patron, texto_guia, re.IGNORECASE | re.DOTALL)
-        if match:
-            try: return datetime.strptime(match.group(1).title(), '%d %b %Y').strftime('%Y-%m-%d')
-            except ValueError: continue
-    return ""
-
-def pdf_extraer_fecha_dhl(texto_guia):
-    match = re.search(r"(\d{4}-\d{2}-\d{2})\s*MyDHL", texto_guia)
-    return match.group(1) if match else ""
-
-def pdf_extraer_fecha_fedex(texto_guia):
-    match = re.search(r"SHIP DATE:\s*(\d{2}[A-Z]{3}\d{2})", texto_guia, re.IGNORECASE)
-    if not match: return ""
-    try: return datetime.strptime(match.group(1).title(), '%d%b%y').strftime('%Y-%m-%d')
-    except ValueError: return ""
-
-def pdf_extraer_fecha_guia(texto_guia, operador):
-    if operador == "UPS": return pdf_extraer_fecha_ups(texto_guia)
-    elif operador == "DHL": return pdf_extraer_fecha_dhl(texto_guia)
-    elif operador == "FedEx": return pdf_extraer_fecha_fedex(texto_guia)
-    return ""
-
-def procesar_archivos_guias_pdf(archivos):
-    datos_pdf = []
-    for archivo in archivos:
-        try:
-            with pdfplumber.open(archivo) as pdf:
-                texto_completo = "\n".join(page.extract_text(x_tolerance=1) or "" for page in pdf.pages)
-            
-            texto_normalizado = re.sub(r'\s+', ' ', texto_completo)
-            operador = pdf_detectar_operador(texto_normalizado)
-            
-            if operador == "UPS":
-                tracking = pdf_extraer_tracking(texto_normalizado, operador)
-                if tracking:
-                    datos_pdf.append({
-                        "Tracking": tracking,
-                        "Fecha_Guia": pdf_extraer_fecha_guia(texto_normalizado, operador),
-                        "Pais_Destino_Guia": pdf_extraer_pais_destino(texto_normalizado),
-                        "Peso_Neto_Guia": pdf_extraer_peso_neto(texto_normalizado, operador),
-                        "FMM_Guia": pdf_extraer_fmm_guia(texto_normalizado, operador),
-                        "Remitente_Usuario_Guia": pdf_extraer_remitente(texto_normalizado),
-                        "Facturas_Guia": pdf_extraer_facturas(texto_normalizado, operador, "")
-                    })
-            else:
-                patrones_inicio = [r"ORIGIN ID:", r"EXPRESS WORLDWIDE", r"UPS WORLDWIDE SERVICE"]
-                indices = [m.start() for m in re.finditer("|".join(patrones_inicio), texto_normalizado)]
-                bloques_guias = []
-                
-                if not indices:
-                    bloques_guias.append(texto_normalizado)
-                else:
-                    for i in range(len(indices)):
-                        inicio = indices[i]
-                        fin = indices[i+1] if i + 1 < len(indices) else len(texto_normalizado)
-                        bloques_guias.append(texto_normalizado[inicio:fin])
-                
-                ultimo_ref_dhl = ""
-                for bloque in bloques_guias:
-                    operador_bloque = pdf_detectar_operador(bloque)
-                    if operador_bloque == "DHL":
-                        match_ref = re.search(r"#(\d{6,})", bloque)
-                        if match_ref: ultimo_ref_dhl = match_ref.group(1)
-                    tracking = pdf_extraer_tracking(bloque, operador_bloque)
-                    if tracking:
-                        datos_pdf.append({
-                            "Tracking": tracking,
-                            "Fecha_Guia": pdf_extraer_fecha_guia(bloque, operador_bloque),
-                            "Pais_Destino_Guia": pdf_extraer_pais_destino(bloque),
-                            "Peso_Neto_Guia": pdf_extraer_peso_neto(bloque, operador_bloque),
-                            "FMM_Guia": pdf_extraer_fmm_guia(bloque, operador_bloque),
-                            "Remitente_Usuario_Guia": pdf_extraer_remitente(bloque),
-                            "Facturas_Guia": pdf_extraer_facturas(bloque, operador_bloque, ultimo_ref_dhl)
-                        })
-                        
-        except Exception as e:
-            st.error(f"Error procesando {archivo.name}: {e}")
-    
-    # Eliminar duplicados
-    df = pd.DataFrame(datos_pdf)
-    if not df.empty:
-        df = df.drop_duplicates(subset=['Tracking'], keep='first')
-    return df
-
-def procesar_formulario_pdf(archivo):
-    try:
-        with pdfplumber.open(archivo) as pdf:
-            contenido_completo = "\n".join(page.extract_text(x_tolerance=1) or "" for page in pdf.pages)
-            lineas = contenido_completo.splitlines()
-    except Exception as e:
-        st.error(f"Error leyendo formulario {archivo.name}: {e}")
-        return []
-    
-    # Extracción de datos básicos
-    fmm_formulario, usuario, pais_destino = "", "", ""
-    
-    for linea in lineas:
-        if "FORMULARIO No. No." in linea:
-            match = re.search(r'FORMULARIO No\. No\.\s*(\d+)', linea)
-            if match: fmm_formulario = match.group(1)
-    
-    for linea in lineas:
-        if "1. USUARIO:" in linea:
-            match = re.search(r'1\.\s*USUARIO:\s*(SOLIDEO\s*S\.?A?\.?S\.?)', linea, re.IGNORECASE)
-            if match: usuario = "SOLIDEO S.A.S."
-    
-    for i, linea in enumerate(lineas):
-        if "22. País Destino:" in linea:
-            match = re.search(r'22\.\s*País Destino:\s*(\d+\s+[A-Z\s]+)', linea)
-            if match:
-                pais_destino = re.sub(r'^\d+\s*', '', match.group(1).strip()).strip()
-    
-    # LÓGICA MEJORADA PARA FACTURAS
-    en_anexos = False
-    facturas_con_info = []  # Almacenar (factura, tiene_comentarios, prefijo)
-
-    for i, linea in enumerate(lineas):
-        if "DETALLE DE LOS ANEXOS" in linea:
-            en_anexos = True
-            continue
-        
-        if en_anexos and "FACTURA COMERCIAL" in linea:
-            # Buscar facturas en la línea
-            facturas_en_linea = re.findall(r'\b(ZFFE\d+|ZFFV\d+)\b', linea)
-            
-            for factura in facturas_en_linea:
-                # Verificar si hay comentarios después de la fecha
-                patron = factura + r'.*?(\d{4}/\d{2}/\d{2})\s*(.*)'
-                match = re.search(patron, linea)
-                
-                tiene_comentarios = False
-                if match:
-                    texto_despues_fecha = match.group(2).strip()
-                    if texto_despues_fecha:
-                        tiene_comentarios = True
-                
-                prefijo = factura[:4]  # ZFFV o ZFFE
-                facturas_con_info.append((factura, tiene_comentarios, prefijo))
-
-    # Aplicar reglas de selección
-    facturas_validas = []
-    
-    if len(facturas_con_info) == 1:
-        # Si solo hay una factura, extraerla sin importar prefijo o comentarios
-        factura, tiene_comentarios, prefijo = facturas_con_info[0]
-        facturas_validas.append(factura)
-    
-    elif len(facturas_con_info) > 1:
-        # PRIMERO: Filtrar solo facturas ZFFV (cuando hay múltiples de diferentes prefijos)
-        facturas_zffv = [(f, com) for f, com, pref in facturas_con_info if pref == 'ZFFV']
-        facturas_zffe = [(f, com) for f, com, pref in facturas_con_info if pref == 'ZFFE']
-        
-        # Si hay facturas ZFFV, trabajar solo con ellas
-        if facturas_zffv:
-            # Entre las ZFFV, buscar las sin comentarios
-            facturas_sin_comentarios = [f for f, com in facturas_zffv if not com]
-            
-            if facturas_sin_comentarios:
-                # Tomar la primera ZFFV sin comentarios
-                facturas_validas.append(facturas_sin_comentarios[0])
-            else:
-                # Si todas las ZFFV tienen comentarios, tomar la primera ZFFV
-                facturas_validas.append(facturas_zffv[0][0])
-        else:
-            # Si no hay ZFFV pero hay ZFFE (y hay múltiples facturas)
-            # Tomar la primera ZFFE sin comentarios, o la primera si todas tienen comentarios
-            facturas_sin_comentarios = [f for f, com in facturas_zffe if not com]
-            if facturas_sin_comentarios:
-                facturas_validas.append(facturas_sin_comentarios[0])
-            elif facturas_zffe:
-                facturas_validas.append(facturas_zffe[0][0])
-    
-    factura_a_asignar = ", ".join(sorted(set(facturas_validas))) if facturas_validas else ""
-    
-    # Extraer guías de la sección de anexos
-    datos_finales = []
-    en_seccion_anexos = False
-    
-    for linea in lineas:
-        if "DETALLE DE LOS ANEXOS" in linea:
-            en_seccion_anexos = True
-            continue
-        
-        if en_seccion_anexos:
-            if re.search(r'127\s+GUIAS DE TRAFICO POSTAL', linea) or re.search(r'127\s+GUAS DE TRAFICO POSTAL', linea):
-                patrones = [
-                    r'\b(8837\d{8})\b',
-                    r'\b(\d{4}\s\d{4}\s\d{4})\b',
-                    r'\b(\d{12})\b', 
-                    r'\b(COJE[A-Z0-9]{8,})\b',
-                    r'\b(\d{9,10})\b'
-                ]
-                
-                for patron in patrones:
-                    matches = re.findall(patron, linea)
-                    for match in matches:
-                        tracking = match.replace(" ", "") if isinstance(match, str) else match
-                        fecha_match = re.search(r'(\d{4}/\d{2}/\d{2})', linea)
-                        fecha = ""
-                        if fecha_match:
-                            try:
-                                fecha = datetime.strptime(fecha_match.group(1), '%Y/%m/%d').strftime('%Y-%m-%d')
-                            except:
-                                fecha = ""
-                        
-                        datos_finales.append({
-                            "Tracking": tracking,
-                            "Fecha_FMM": fecha,
-                            "Pais_Destino_FMM": pais_destino,
-                            "FMM_Formulario": fmm_formulario,
-                            "Remitente_Usuario_FMM": usuario,
-                            "Facturas_FMM": factura_a_asignar
-                        })
-                        break
-    
-    # Eliminar duplicados
-    unique_data = []
-    seen_trackings = set()
-    for item in datos_finales:
-        if item['Tracking'] not in seen_trackings:
-            unique_data.append(item)
-            seen_trackings.add(item['Tracking'])
-    
-    return unique_data
-    
-# --- INTERFAZ STREAMLIT ---
-def main():
-    st.title("📦 Sistema de Conciliación de Guías Aéreas")
-    st.markdown("---")
-    
-    # Inicializar session state
-    if 'resultados' not in st.session_state:
-        st.session_state.resultados = None
-    if 'procesamiento_completado' not in st.session_state:
-        st.session_state.procesamiento_completado = False
-    
-    # Contador único para forzar la actualización de file uploaders
-    if 'uploader_key_counter' not in st.session_state:
-        st.session_state.uploader_key_counter = 0
-    
-    # Sidebar para carga de archivos
-    with st.sidebar:
-        st.header("📂 Cargar Archivos")
-        
-        # File uploaders con keys dinámicas
-        archivos_guias = st.file_uploader(
-            "Guías PDF (FedEx, UPS, DHL)", 
-            type="pdf", 
-            accept_multiple_files=True,
-            key=f"guias_uploader_{st.session_state.uploader_key_counter}"
-        )
-        
-        archivos_formularios = st.file_uploader(
-            "Formularios PDF", 
-            type="pdf", 
-            accept_multiple_files=True,
-            key=f"formularios_uploader_{st.session_state.uploader_key_counter}"
-        )
-        
-        if st.button("🔄 Procesar Conciliación", type="primary"):
-            if archivos_guias and archivos_formularios:
-                with st.spinner("Procesando archivos..."):
-                    try:
-                        # Procesar guías
-                        df_guias = procesar_archivos_guias_pdf(archivos_guias)
-                        st.info(f"Guías procesadas: {len(df_guias)}")
-                        
-                        # Procesar formularios
-                        todos_datos_formularios = []
-                        for archivo in archivos_formularios:
-                            datos = procesar_formulario_pdf(archivo)
-                            todos_datos_formularios.extend(datos)
-                        
-                        df_formularios = pd.DataFrame(todos_datos_formularios)
-                        st.info(f"Guías procesadas en el formulario: {len(df_formularios)}")
-                        
-                        if not df_guias.empty and not df_formularios.empty:
-                            # Conciliación con verificación real de datos
-                            df_conciliado = pd.merge(
-                                df_guias, 
-                                df_formularios, 
-                                on='Tracking', 
-                                how='outer', 
-                                indicator=True,
-                                suffixes=('_Guia', '_FMM')
-                            )
-                            
-                            # --- MAPEO DE PAÍSES ---
-                            mapa_paises = {
-                                "US": "UNITED STATES OF AMERICA", 
-                                "ESTADOS UNIDOS": "UNITED STATES OF AMERICA", 
-                                "JP": "JAPAN"
-                            }
-                            
-                            df_conciliado['Pais_Normalizado_Guia'] = df_conciliado['Pais_Destino_Guia'].str.upper().map(mapa_paises).fillna(df_conciliado['Pais_Destino_Guia'].str.upper())
-                            df_conciliado['Pais_Normalizado_FMM'] = df_conciliado['Pais_Destino_FMM'].str.upper().map(mapa_paises).fillna(df_conciliado['Pais_Destino_FMM'].str.upper())
-                            
-                            # Función de análisis REAL con países normalizados
-                            def analizar_fila(row):
-                                if row['_merge'] == 'left_only': 
-                                    return '❌ SOLO EN GUÍA'
-                                if row['_merge'] == 'right_only': 
-                                    return '❌ SOLO EN FMM'
-                                
-                                # Verificar coincidencias reales
-                                diferencias = []
-                                if str(row.get('Fecha_Guia', '')) != str(row.get('Fecha_FMM', '')):
-                                    diferencias.append("Fecha")
-                                if str(row.get('Pais_Normalizado_Guia', '')) != str(row.get('Pais_Normalizado_FMM', '')):
-                                    diferencias.append("País")
-                                if str(row.get('FMM_Guia', '')) != str(row.get('FMM_Formulario', '')):
-                                    diferencias.append("FMM")
-                                if str(row.get('Facturas_Guia', '')) != str(row.get('Facturas_FMM', '')):
-                                    diferencias.append("Facturas")
-                                
-                                if not diferencias:
-                                    return '✅ OK'
-                                else:
-                                    return f'⚠️ Diferencias: {", ".join(diferencias)}'
-                            
-                            df_conciliado['Estado_Conciliacion'] = df_conciliado.apply(analizar_fila, axis=1)
-                            
-                            # ELIMINAR columna _merge (ya no es necesaria)
-                            df_conciliado = df_conciliado.drop(columns=['_merge'], errors='ignore')
-                            
-                            # Reiniciar índice para que empiece en 1
-                            df_conciliado.reset_index(drop=True, inplace=True)
-                            df_conciliado.index = df_conciliado.index + 1
-                            
-                            st.session_state.resultados = df_conciliado
-                            st.session_state.procesamiento_completado = True
-                            st.success("✅ Conciliación completada")
-                            
-                        else:
-                            st.warning("No se pudieron extraer datos suficientes para comparar")
-                            
-                    except Exception as e:
-                        st.error(f"Error en procesamiento: {str(e)}")
-            else:
-                st.warning("⚠️ Debes cargar ambos tipos de archivos")
-    
-    # Botón de limpieza - SIN RECARGAR PÁGINA
-    if st.sidebar.button("🗑️ Limpiar Todo", type="secondary"):
-        # Limpiar todo el estado
-        st.session_state.resultados = None
-        st.session_state.procesamiento_completado = False
-        
-        # Incrementar el contador para forzar nuevos file uploaders
-        st.session_state.uploader_key_counter += 1
-        
-        # Mensaje de confirmación
-        st.sidebar.success("✅ Todo ha sido limpiado. Puedes cargar nuevos archivos.")
-        
-        # Forzar actualización sin recargar toda la página
-        st.rerun()
-    
-    # Mostrar resultados si existen
-    if st.session_state.get('resultados') is not None:
-        st.header("📊 Resultados de Conciliación")
-        
-        # Filtrar columnas para mejor visualización
-        columnas_a_mostrar = [
-            'Tracking', 'Fecha_Guia', 'Fecha_FMM', 
-            'Pais_Normalizado_Guia', 'Pais_Normalizado_FMM',
-            'Peso_Neto_Guia', 'FMM_Guia', 'FMM_Formulario',
-            'Facturas_Guia', 'Facturas_FMM', 'Estado_Conciliacion'
-        ]
-        
-        columnas_existentes = [col for col in columnas_a_mostrar if col in st.session_state.resultados.columns]
-        df_mostrar = st.session_state.resultados[columnas_existentes]
-        
-        # Renombrar columnas para mejor visualización
-        df_mostrar = df_mostrar.rename(columns={
-            'Pais_Normalizado_Guia': 'País_Guia',
-            'Pais_Normalizado_FMM': 'País_FMM',
-            'FMM_Guia': 'FMM_Guía',
-            'FMM_Formulario': 'FMM_Formulario'
-        })
-        
-        st.dataframe(df_mostrar, use_container_width=True)
-        
-        # Estadísticas
-        st.subheader("📈 Resumen de Conciliación")
-        if 'Estado_Conciliacion' in st.session_state.resultados.columns:
-            conteo_estados = st.session_state.resultados['Estado_Conciliacion'].value_counts()
-            
-            col1, col2, col3, col4 = st.columns(4)
-            col1.metric("Total", len(st.session_state.resultados))
-            col2.metric("✅ OK", conteo_estados.get('✅ OK', 0))
-            col3.metric("❌ Solo Guía", conteo_estados.get('❌ SOLO EN GUÍA', 0))
-            col4.metric("❌ Solo FMM", conteo_estados.get('❌ SOLO EN FMM', 0))
-            
-            # Mostrar diferencias si existen
-            diferencias = sum(1 for estado in conteo_estados.index if '⚠️ Diferencias:' in estado)
-            if diferencias > 0:
-                st.metric("⚠️ Con Diferencias", diferencias)
-        
-        # Botón de exportación Excel
-        st.subheader("💾 Exportar Resultados")
-        
-        # Crear archivo Excel en memoria
-        excel_buffer = io.BytesIO()
-        with pd.ExcelWriter(excel_buffer, engine='openpyxl') as writer:
-            df_mostrar.to_excel(writer, index=True, sheet_name='Conciliación')
-        
-        excel_buffer.seek(0)
-        
-        st.download_button(
-            label="📥 Descargar Excel",
-            data=excel_buffer,
-            file_name="conciliacion_guias.xlsx",
-            mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-        )
-    
-    # Mensaje cuando no hay resultados
-    elif st.session_state.get('procesamiento_completado', False):
-        st.info("💡 Usa el botón 'Limpiar Todo' para comenzar una nueva conciliación")
-    
-    # Información de uso
-    with st.expander("ℹ️ Instrucciones de uso"):
-        st.markdown("""
-        **📋 Cómo usar:**
-        1. **Cargar archivos**: Sube las guías PDF y formularios PDF
-        2. **Procesar**: Haz clic en 'Procesar Conciliación'
-        3. **Revisar resultados**: Los resultados se mostrarán en tabla
-        4. **Exportar**: Descarga en Excel si es necesario
-        5. **Limpiar**: Usa 'Limpiar Todo' para borrar TODO y empezar de nuevo
-        
-        **🎯 Características:**
-        - ✅ Limpieza instantánea sin recargar página
-        - ✅ Normalización de países (US = UNITED STATES OF AMERICA)
-        - ✅ Comparación real de fechas, FMM y facturas
-        - ✅ Descarga en formato Excel
-        
-        **📦 Formatos soportados:**
-        - Guías: FedEx, UPS, DHL
-        - Formularios: Formularios de movimiento de mercancías en PDF.
-        """)
-
-if __name__ == "__main__":
-    main()
+import os
+import uuid
+import contextlib
+import threading
+import importlib
+import streamlit as st
+# Solo módulos ligeros al arrancar: pandas, pdfplumber y xlsxwriter se cargan con el primer
+# procesamiento, resultado o exportación (o antes, en segundo plano, tras el primer pintado)
+from archivos import WORKERS_POR_DEFECTO, id_archivo
+from cache_extraccion import CacheExtraccion
+from esquema import CAMPOS_COMPARADOS, ESTADO_OK, ESTADO_SOLO_FMM, ESTADO_SOLO_GUIA, PREFIJO_DIFERENCIAS
+from trabajos import CANCELANDO, TERMINADO, RegistroSesiones
+from almacen_trackings import RETENCION_DIAS_POR_DEFECTO, AlmacenTrackings
+from rendimiento import configurar_log_estructurado
+from exportacion import FORMATOS_EXPORTACION, exportar
+
+# --- CONFIGURACIÓN INICIAL ---
+st.set_page_config(page_title="Sistema de Conciliación de Guías", page_icon="📦", layout="wide")
+configurar_log_estructurado()
+
+# Caché de extracción compartida por todas las sesiones del servidor
+@st.cache_resource
+def obtener_cache():
+    return CacheExtraccion()
+
+# Histórico SQLite de trackings para conciliar entre días
+@st.cache_resource
+def obtener_almacen():
+    return AlmacenTrackings()
+
+# Módulos pesados que se importan en segundo plano una vez por proceso del servidor
+# (CONCILIACION_PRECARGA=0 lo desactiva, p. ej. para medir el arranque en frío)
+PRECARGA = os.environ.get("CONCILIACION_PRECARGA", "1") != "0"
+MODULOS_PRECARGA = ("pandas", "registros", "conciliacion", "conciliacion_incremental", "extraccion", "xlsxwriter")
+
+@st.cache_resource
+def precargar_modulos():
+    hilo = threading.Thread(target=lambda: [importlib.import_module(m) for m in MODULOS_PRECARGA],
+                            name="precarga-modulos", daemon=True)
+    hilo.start()
+    return hilo
+
+def publicar_resultados(df):
+    # Cada resultado nuevo recibe una versión; la exportación en caché se invalida con ella
+    if df is not st.session_state.resultados:
+        st.session_state.version_resultados += 1
+    st.session_state.resultados = df
+
+def calculado(nombre, *parametros):
+    # Valor memorizado si sigue vigente para la versión actual de los resultados; None si no
+    memorizado = st.session_state.calculos.get(nombre)
+    if memorizado is not None and memorizado[0] == (st.session_state.version_resultados, *parametros):
+        return memorizado[1]
+    return None
+
+def por_version(nombre, calcular, *parametros):
+    # Cálculos puros sobre los resultados, memorizados hasta que cambie su versión (o los parámetros)
+    valor = calculado(nombre, *parametros)
+    if valor is None:
+        valor = calcular()
+        st.session_state.calculos[nombre] = ((st.session_state.version_resultados, *parametros), valor)
+    return valor
+
+def resumen_estados(conteo_estados, total):
+    # Métricas del resumen a partir del conteo de filas por estado del índice de resultados
+    return {
+        "total": total,
+        "ok": conteo_estados.get(ESTADO_OK, 0),
+        "solo_guia": conteo_estados.get(ESTADO_SOLO_GUIA, 0),
+        "solo_fmm": conteo_estados.get(ESTADO_SOLO_FMM, 0),
+        "tipos_diferencias": sum(1 for estado in conteo_estados if PREFIJO_DIFERENCIAS in estado),
+    }
+
+# --- EXPORTACIÓN ---
+def exportacion_en_cache(cache, clave, df, rendimiento=None):
+    # Se llama solo al pulsar descargar; guarda el último archivo generado por (versión, filtro, opciones)
+    if cache.get("clave") != clave:
+        cache.clear()
+        _, _, formato, por_estado = clave
+        with rendimiento.etapa("exportacion", formato=formato, registros=len(df)) if rendimiento else contextlib.nullcontext():
+            cache["datos"] = exportar(df, formato, por_estado)
+        cache["clave"] = clave
+    return cache["datos"]
+
+# --- PROCESAMIENTO EN SEGUNDO PLANO ---
+# Conciliaciones y trabajos de todas las pestañas, compartidos por el proceso del servidor
+@st.cache_resource
+def obtener_sesiones():
+    return RegistroSesiones()
+
+def id_sesion_actual():
+    # El id va en la URL para recuperar la conciliación y el trabajo en curso al recargar el navegador
+    id_sesion = st.query_params.get("sesion")
+    if not id_sesion:
+        id_sesion = uuid.uuid4().hex[:12]
+        st.query_params["sesion"] = id_sesion
+    return id_sesion
+
+def cambios_cargados(sesion, guias, formularios):
+    # Archivos nuevos y quitados frente a la conciliación de la sesión. Solo se quitan los que se vieron
+    # en el cargador de esta pestaña: al recargar el navegador el cargador vuelve vacío y la
+    # conciliación recuperada se conserva
+    vistos = st.session_state.ids_vistos
+    vistos.update(guias, formularios)
+    if not sesion.iniciada: return list(guias), [], list(formularios), []
+    conciliacion = sesion.conciliacion
+    return (
+        [i for i in guias if i not in conciliacion.guias],
+        [i for i in conciliacion.guias if i not in guias and i in vistos],
+        [i for i in formularios if i not in conciliacion.formularios],
+        [i for i in conciliacion.formularios if i not in formularios and i in vistos],
+    )
+
+def lanzar_trabajo(sesion, guias, formularios, cambios, **opciones):
+    guias_nuevas, guias_quitadas, formularios_nuevos, formularios_quitados = cambios
+    trabajo = sesion.lanzar({i: guias[i] for i in guias_nuevas}, {i: formularios[i] for i in formularios_nuevos},
+                            guias_quitadas, formularios_quitados, **opciones)
+    st.session_state.rendimiento = trabajo.rendimiento
+    st.session_state.procesamiento_completado = False
+
+def mostrar_progreso(sesion):
+    # Se refresca cada segundo mientras el trabajo está activo; al terminar recarga la app completa
+    trabajo = sesion.trabajo
+    if not trabajo.activo:
+        st.rerun()
+    progreso = trabajo.progreso()
+    eta = f"~{progreso['eta_segundos']:.0f} s restantes" if progreso['eta_segundos'] is not None else "calculando..."
+    st.progress(
+        progreso["fraccion"],
+        text=f"Procesando archivos: {progreso['completados']}/{progreso['total']} · {progreso['ultimo_archivo']}"
+    )
+    col1, col2 = st.columns([4, 1])
+    col1.caption(
+        f"{progreso['archivos_por_segundo']:.1f} archivos/s · {progreso['registros']} registros · "
+        f"{progreso['segundos']:.0f} s transcurridos · {eta}"
+    )
+    if col2.button("⏹️ Cancelar", disabled=progreso["estado"] == CANCELANDO,
+                   help="Detiene el procesamiento; los archivos ya terminados se conservan"):
+        trabajo.cancelar()
+
+def publicar_trabajo(sesion):
+    # Publica el resultado del último trabajo una sola vez por sesión del navegador
+    trabajo = sesion.trabajo
+    if trabajo is None or trabajo.activo or st.session_state.get('trabajo_publicado') == trabajo.id: return
+    st.session_state.trabajo_publicado = trabajo.id
+    st.session_state.rendimiento = trabajo.rendimiento
+    publicar_resultados(sesion.conciliacion.resultados)
+    st.session_state.procesamiento_completado = trabajo.estado == TERMINADO and sesion.conciliacion.resultados is not None
+
+def resumen_trabajo(sesion):
+    trabajo = sesion.trabajo
+    if trabajo is None or trabajo.activo: return
+    for error in trabajo.errores:
+        st.error(error)
+    st.info(f"Guías procesadas: {sesion.conciliacion.total_guias}")
+    st.info(f"Guías procesadas en el formulario: {sesion.conciliacion.total_formularios}")
+    if trabajo.estado != TERMINADO:
+        progreso = trabajo.progreso()
+        st.warning(f"Procesamiento {trabajo.estado}: {progreso['completados']} de {progreso['total']} archivos aplicados. "
+                   "Pulsa 'Procesar Conciliación' para continuar con el resto")
+    elif sesion.conciliacion.resultados is not None:
+        st.success("✅ Conciliación completada")
+    else:
+        st.warning("No se pudieron extraer datos suficientes para comparar")
+
+# --- INTERFAZ STREAMLIT ---
+def main():
+    st.title("📦 Sistema de Conciliación de Guías Aéreas")
+    st.markdown("---")
+    
+    # Inicializar session state
+    if 'resultados' not in st.session_state:
+        st.session_state.resultados = None
+    if 'version_resultados' not in st.session_state:
+        st.session_state.version_resultados = 0
+    if 'exportacion' not in st.session_state:
+        st.session_state.exportacion = {}
+    if 'calculos' not in st.session_state:
+        st.session_state.calculos = {}
+    if 'procesamiento_completado' not in st.session_state:
+        st.session_state.procesamiento_completado = False
+    
+    if 'rendimiento' not in st.session_state:
+        st.session_state.rendimiento = None
+    
+    # Contador único para forzar la actualización de file uploaders
+    if 'uploader_key_counter' not in st.session_state:
+        st.session_state.uploader_key_counter = 0
+    if 'ids_vistos' not in st.session_state:
+        st.session_state.ids_vistos = set()
+    
+    # Registros extraídos por archivo (indexados por Tracking) y trabajo en segundo plano
+    id_sesion = id_sesion_actual()
+    sesion = obtener_sesiones().obtener(id_sesion)
+    publicar_trabajo(sesion)
+    
+    # Sidebar para carga de archivos
+    with st.sidebar:
+        st.header("📂 Cargar Archivos")
+        
+        # File uploaders con keys dinámicas
+        # Los ZIP se descomprimen miembro a miembro a disco al procesarlos; los PDF repetidos se omiten
+        archivos_guias = st.file_uploader(
+            "Guías PDF o ZIP (FedEx, UPS, DHL)", 
+            type=["pdf", "zip"], 
+            accept_multiple_files=True,
+            key=f"guias_uploader_{st.session_state.uploader_key_counter}"
+        )
+        
+        archivos_formularios = st.file_uploader(
+            "Formularios PDF o ZIP", 
+            type=["pdf", "zip"], 
+            accept_multiple_files=True,
+            key=f"formularios_uploader_{st.session_state.uploader_key_counter}"
+        )
+        
+        workers = st.number_input(
+            "Procesos de extracción",
+            min_value=1,
+            max_value=os.cpu_count() or 1,
+            value=WORKERS_POR_DEFECTO,
+            help="Número de archivos PDF que se procesan en paralelo (1 = secuencial)"
+        )
+        usar_cache = st.checkbox(
+            "Usar caché de extracción",
+            value=True,
+            help="Reutiliza el texto y los registros de PDFs ya procesados (mismo contenido)"
+        )
+        por_paginas = st.checkbox(
+            "Leer guías página a página",
+            value=False,
+            help="Para PDFs de guías muy grandes: procesa las páginas a medida que se leen sin cargar el texto completo en memoria"
+        )
+        formularios_dirigido = st.checkbox(
+            "Extracción dirigida de formularios",
+            value=True,
+            help="Lee solo las páginas del formulario con encabezado o anexos; si no encuentra las anclas usa la extracción completa"
+        )
+        guardar_historico = st.checkbox(
+            "Guardar en el histórico",
+            value=False,
+            help="Acumula las guías y formularios procesados para conciliarlos con los de otros días"
+        )
+        
+        # Tras la primera conciliación, agregar o quitar archivos actualiza solo las filas afectadas.
+        # El procesamiento corre en segundo plano: la página sigue respondiendo mientras tanto
+        procesar = st.button("🔄 Procesar Conciliación", type="primary", disabled=sesion.ocupada)
+        guias = {id_archivo(a): a for a in archivos_guias or []}
+        formularios = {id_archivo(a): a for a in archivos_formularios or []}
+        cambios = cambios_cargados(sesion, guias, formularios) if not sesion.ocupada else ()
+        if procesar and not (archivos_guias and archivos_formularios):
+            st.warning("⚠️ Debes cargar ambos tipos de archivos")
+        elif not sesion.ocupada and (procesar or (st.session_state.procesamiento_completado and any(cambios))):
+            lanzar_trabajo(
+                sesion, guias, formularios, cambios,
+                workers=workers,
+                cache=obtener_cache() if usar_cache else None,
+                por_paginas=por_paginas,
+                formularios_dirigido=formularios_dirigido,
+                almacen=obtener_almacen() if guardar_historico else None
+            )
+        resumen_trabajo(sesion)
+
+    # Botón de limpieza - SIN RECARGAR PÁGINA
+    if st.sidebar.button("🗑️ Limpiar Todo", type="secondary"):
+        # Limpiar todo el estado
+        publicar_resultados(None)
+        st.session_state.exportacion = {}
+        st.session_state.calculos = {}
+        st.session_state.procesamiento_completado = False
+        st.session_state.rendimiento = None
+        obtener_sesiones().reiniciar(id_sesion)
+        st.session_state.ids_vistos = set()
+        
+        # Incrementar el contador para forzar nuevos file uploaders
+        st.session_state.uploader_key_counter += 1
+        
+        # Mensaje de confirmación
+        st.sidebar.success("✅ Todo ha sido limpiado. Puedes cargar nuevos archivos.")
+        
+        # Forzar actualización sin recargar toda la página
+        st.rerun()
+    
+    # Estadísticas de la caché de extracción
+    with st.sidebar.expander("🗄️ Caché de extracción"):
+        estadisticas = obtener_cache().estadisticas()
+        col1, col2 = st.columns(2)
+        col1.metric("Aciertos", estadisticas["aciertos"])
+        col2.metric("Fallos", estadisticas["fallos"])
+        st.caption(
+            f"Tasa de aciertos: {estadisticas['tasa_aciertos']:.0%} · "
+            f"{estadisticas['entradas']} archivos · {estadisticas['megabytes']:.1f} MB · "
+            f"{estadisticas['desalojos']} desalojos"
+        )
+        if st.button("Vaciar caché"):
+            obtener_cache().vaciar()
+            st.rerun()
+    
+    # Conciliación contra la ventana abierta del histórico
+    with st.sidebar.expander("🗃️ Histórico de trackings"):
+        almacen = obtener_almacen()
+        estadisticas = almacen.estadisticas()
+        st.caption(
+            f"Guías abiertas: {estadisticas['guias_abiertas']} de {estadisticas['guias']} · "
+            f"Formularios abiertos: {estadisticas['formularios_abiertos']} de {estadisticas['formularios']}"
+        )
+        rango = st.date_input("Rango de fechas (opcional)", value=(), help="Sin rango se concilian todos los trackings abiertos")
+        if st.button("Conciliar ventana abierta"):
+            desde = rango[0].isoformat() if len(rango) > 0 else None
+            hasta = rango[-1].isoformat() if len(rango) > 1 else None
+            publicar_resultados(almacen.conciliar_ventana(desde, hasta))
+            if st.session_state.resultados is None:
+                st.warning("No hay trackings abiertos en la ventana indicada")
+        if st.button("Cerrar trackings OK", disabled=st.session_state.resultados is None,
+                     help="Marca como cerrados en el histórico los trackings conciliados sin diferencias"):
+            st.success(f"Trackings cerrados: {almacen.cerrar(st.session_state.resultados)}")
+        retencion = st.number_input("Retención de cerrados (días)", min_value=0, value=RETENCION_DIAS_POR_DEFECTO)
+        if st.button("Depurar cerrados"):
+            st.success(f"Registros eliminados: {almacen.depurar(retencion)}")
+    
+    # Progreso del trabajo en curso (también si terminó antes de llegar aquí y aún no se publicó)
+    if sesion.trabajo is not None and st.session_state.get('trabajo_publicado') != sesion.trabajo.id:
+        st.fragment(mostrar_progreso, run_every=1)(sesion)
+    
+    # Mostrar resultados si existen
+    if st.session_state.get('resultados') is not None:
+        st.header("📊 Resultados de Conciliación")
+        
+        resultados = st.session_state.resultados
+        from vista_resultados import TAMANOS_PAGINA, IndiceResultados, numero_paginas
+        
+        # Índice por estado, campo con diferencias y tracking, calculado una vez por versión de resultados.
+        # Los filtros se resuelven en el servidor y a la tabla solo llega la página visible
+        indice = por_version("indice", lambda: IndiceResultados(resultados))
+        conteo_estados = indice.conteo_estados()
+        etiquetas_campos = {etiqueta: col_dif for _, _, etiqueta, col_dif in CAMPOS_COMPARADOS
+                            if col_dif in indice.columnas_diferencia}
+        # Un estado elegido que ya no tiene filas en los resultados nuevos deja de ser una opción
+        st.session_state.filtro_estados = [e for e in st.session_state.get("filtro_estados", []) if e in conteo_estados]
+        col1, col2, col3 = st.columns([2, 2, 1])
+        estados_filtro = col1.multiselect("Estado:", list(conteo_estados), key="filtro_estados",
+                                          format_func=lambda estado: f"{estado} ({conteo_estados[estado]})")
+        campos_filtro = col2.multiselect("Mostrar solo filas con diferencias en:", list(etiquetas_campos),
+                                         key="filtro_campos")
+        busqueda = col3.text_input("Buscar tracking:", key="filtro_tracking",
+                                   help="Trackings que empiezan por el texto indicado (sin importar espacios ni guiones)")
+        filtros = (tuple(estados_filtro), tuple(campos_filtro), busqueda.strip())
+        posiciones = por_version(
+            "filtro", lambda: indice.filtrar(estados_filtro, [etiquetas_campos[c] for c in campos_filtro], busqueda),
+            filtros
+        )
+        
+        # Paginación: vuelve a la primera página al cambiar los resultados o los filtros
+        tamano = st.session_state.get("tamano_pagina", TAMANOS_PAGINA[0])
+        paginas = numero_paginas(len(posiciones), tamano)
+        if st.session_state.get("filtros_pagina") != (st.session_state.version_resultados, filtros, tamano):
+            st.session_state.filtros_pagina = (st.session_state.version_resultados, filtros, tamano)
+            st.session_state.pagina_resultados = 1
+        st.session_state.pagina_resultados = min(st.session_state.get("pagina_resultados", 1), paginas)
+        
+        st.dataframe(indice.pagina(posiciones, st.session_state.pagina_resultados, tamano), use_container_width=True,
+                     column_config={
+                         'Fecha_Guia': st.column_config.DateColumn(format="YYYY-MM-DD"),
+                         'Fecha_FMM': st.column_config.DateColumn(format="YYYY-MM-DD"),
+                         'Peso_Neto_Guia': st.column_config.NumberColumn(format="%.2f"),
+                     })
+        col1, col2, col3 = st.columns([1, 1, 3])
+        col1.number_input("Página", min_value=1, max_value=paginas, key="pagina_resultados")
+        col2.selectbox("Filas por página", TAMANOS_PAGINA, key="tamano_pagina")
+        primera = (st.session_state.pagina_resultados - 1) * tamano
+        col3.caption(f"Filas {min(primera + 1, len(posiciones))}–{min(primera + tamano, len(posiciones))} de "
+                     f"{len(posiciones)} ({indice.total} en total) · página {st.session_state.pagina_resultados} de {paginas}")
+        
+        # Estadísticas
+        st.subheader("📈 Resumen de Conciliación")
+        if 'Estado_Conciliacion' in st.session_state.resultados.columns:
+            resumen = resumen_estados(conteo_estados, indice.total)
+            
+            col1, col2, col3, col4 = st.columns(4)
+            col1.metric("Total", resumen["total"])
+            col2.metric("✅ OK", resumen["ok"])
+            col3.metric("❌ Solo Guía", resumen["solo_guia"])
+            col4.metric("❌ Solo FMM", resumen["solo_fmm"])
+            
+            # Mostrar diferencias si existen
+            if resumen["tipos_diferencias"] > 0:
+                st.metric("⚠️ Con Diferencias", resumen["tipos_diferencias"])
+            
+            # Posibles parejas de los trackings sin coincidencia (bajo demanda, por versión de resultados)
+            if resumen["solo_guia"] and resumen["solo_fmm"]:
+                if st.button("🔎 Buscar posibles parejas de trackings sin coincidencia",
+                             help="Trackings de guía y de FMM que difieren en uno o dos caracteres"):
+                    from sugerencias import sugerir_pares
+                    rendimiento = st.session_state.get('rendimiento')
+                    with rendimiento.etapa("sugerencias", registros=len(st.session_state.resultados)) if rendimiento else contextlib.nullcontext():
+                        por_version("sugerencias", lambda: sugerir_pares(st.session_state.resultados))
+                sugerencias = calculado("sugerencias")
+                if sugerencias is not None:
+                    if sugerencias.empty:
+                        st.info("No se encontraron trackings parecidos")
+                    else:
+                        st.dataframe(sugerencias, use_container_width=True, hide_index=True, column_config={
+                            'Similitud': st.column_config.ProgressColumn(format="%.2f", min_value=0, max_value=1),
+                        })
+        
+        # Botón de exportación
+        st.subheader("💾 Exportar Resultados")
+        
+        # El archivo (todas las filas filtradas, no solo la página) se genera al pulsar descargar y se
+        # reutiliza mientras no cambien los resultados, los filtros ni las opciones
+        col1, col2 = st.columns(2)
+        formato = col1.radio("Formato", list(FORMATOS_EXPORTACION), horizontal=True)
+        por_estado = col2.checkbox(
+            "Una hoja por estado",
+            disabled=formato != "Excel",
+            help="Añade hojas con los OK, las diferencias y los que faltan en la guía o en el FMM"
+        ) and formato == "Excel"
+        extension, mime = FORMATOS_EXPORTACION[formato]
+        clave = (st.session_state.version_resultados, filtros, formato, por_estado)
+        cache_exportacion, rendimiento = st.session_state.exportacion, st.session_state.get('rendimiento')
+        
+        st.download_button(
+            label=f"📥 Descargar {formato}",
+            data=lambda: exportacion_en_cache(cache_exportacion, clave, indice.vista(posiciones), rendimiento),
+            file_name=f"conciliacion_guias{extension}",
+            mime=mime,
+            on_click="ignore"
+        )
+    
+    # Mensaje cuando no hay resultados
+    elif st.session_state.get('procesamiento_completado', False):
+        st.info("💡 Usa el botón 'Limpiar Todo' para comenzar una nueva conciliación")
+    
+    # Tiempos por etapa y por archivo del último procesamiento
+    if st.session_state.get('rendimiento') is not None:
+        rendimiento = st.session_state.rendimiento
+        with st.expander("⏱️ Rendimiento"):
+            st.markdown("**Etapas**")
+            st.dataframe(rendimiento.etapas, use_container_width=True, hide_index=True)
+            if rendimiento.archivos:
+                st.markdown("**Archivos (más lentos primero)**")
+                archivos = sorted(rendimiento.archivos, key=lambda metricas: metricas["segundos"], reverse=True)
+                st.dataframe(archivos, use_container_width=True, hide_index=True)
+            st.download_button(
+                label="📥 Descargar JSON",
+                data=rendimiento.como_json(),
+                file_name=f"rendimiento_{rendimiento.id_lote}.json",
+                mime="application/json"
+            )
+    
+    # Información de uso
+    with st.expander("ℹ️ Instrucciones de uso"):
+        st.markdown("""
+        **📋 Cómo usar:**
+        1. **Cargar archivos**: Sube las guías y formularios en PDF o en archivos ZIP con los PDF
+        2. **Procesar**: Haz clic en 'Procesar Conciliación'; el avance se muestra por archivo y puedes cancelarlo.
+           Luego, al agregar o quitar archivos, la tabla se actualiza sola
+        3. **Revisar resultados**: Los resultados se muestran por páginas; filtra por estado, por campo con
+           diferencias o busca un tracking
+        4. **Exportar**: Descarga en Excel (opcionalmente una hoja por estado), CSV o Parquet
+        5. **Limpiar**: Usa 'Limpiar Todo' para borrar TODO y empezar de nuevo
+        
+        **🎯 Características:**
+        - ✅ Limpieza instantánea sin recargar página
+        - ✅ Normalización de países (US = UNITED STATES OF AMERICA)
+        - ✅ Comparación real de fechas, FMM y facturas
+        - ✅ Descarga en Excel, CSV o Parquet
+        - ✅ Posibles parejas para trackings sin coincidencia (uno o dos caracteres distintos)
+        
+        **📦 Formatos soportados:**
+        - Guías: FedEx, UPS, DHL
+        - Formularios: Formularios de movimiento de mercancías en PDF.
+        """)
+    
+    # Con la página ya dibujada, el motor se importa en segundo plano para el primer procesamiento
+    if PRECARGA:
+        precargar_modulos()
+
+if __name__ == "__main__":
+    main()
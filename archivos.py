@@ -0,0 +1,15 @@
+import os
+
+# Identificación de los archivos cargados, sin dependencias pesadas (la app la usa antes de
+# importar el motor de extracción)
+
+# Número de procesos por defecto para la extracción en paralelo
+WORKERS_POR_DEFECTO = min(4, os.cpu_count() or 1)
+
+def nombre_archivo(archivo):
+    nombre = getattr(archivo, "name", None)
+    return nombre if nombre else os.path.basename(str(archivo))
+
+def id_archivo(archivo):
+    # Identificador estable de un archivo cargado (file_id de Streamlit) o de una ruta
+    return getattr(archivo, "file_id", None) or str(getattr(archivo, "name", None) or archivo)
@@ -0,0 +1,218 @@
+# Benchmark de extracción y conciliación con PDFs sintéticos (FedEx, DHL, UPS y formularios FMM).
+#
+#   python benchmark.py --tamanos 50 200 1000 --salida benchmark_resultados.json
+#
+# Cada etapa se mide por separado para cada tamaño de lote (número de guías) y los resultados
+# se guardan en JSON para comparar ejecuciones.
+import io
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import tempfile
+import subprocess
+from datetime import date, datetime, timedelta
+import pandas as pd
+import extraccion
+from extraccion import (
+    analizar_lineas_formulario, analizar_texto_guias, leer_lineas_formulario,
+    leer_lineas_formulario_dirigido, leer_texto_guias
+)
+from conciliacion import clasificar_conciliacion, unir_registros
+from exportacion import FORMATOS_EXPORTACION, exportar
+from registros import formularios_a_dataframe, guias_a_dataframe
+
+LINEAS_POR_PAGINA = 50
+GUIAS_POR_FORMULARIO = 100
+
+# --- ESCRITOR PDF MÍNIMO (Helvetica, WinAnsiEncoding, una línea de texto por renglón) ---
+def _escapar_pdf(linea):
+    return linea.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)").encode("cp1252", "replace")
+
+def escribir_pdf(ruta, paginas):
+    objetos = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        None,
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>",
+    ]
+    ids_paginas = []
+    for lineas in paginas:
+        contenido = b"BT /F1 10 Tf 14 TL 30 760 Td " + b"".join(b"(" + _escapar_pdf(l) + b") Tj T* " for l in lineas) + b"ET"
+        objetos.append(b"<< /Length %d >>\nstream\n" % len(contenido) + contenido + b"\nendstream")
+        objetos.append(b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+                       b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % len(objetos))
+        ids_paginas.append(len(objetos))
+    objetos[1] = b"<< /Type /Pages /Kids [" + b" ".join(b"%d 0 R" % i for i in ids_paginas) + b"] /Count %d >>" % len(ids_paginas)
+
+    salida = io.BytesIO()
+    salida.write(b"%PDF-1.4\n")
+    posiciones = []
+    for numero, objeto in enumerate(objetos, start=1):
+        posiciones.append(salida.tell())
+        salida.write(b"%d 0 obj\n" % numero + objeto + b"\nendobj\n")
+    inicio_xref = salida.tell()
+    salida.write(b"xref\n0 %d\n0000000000 65535 f \n" % (len(objetos) + 1))
+    salida.write(b"".join(b"%010d 00000 n \n" % p for p in posiciones))
+    salida.write(b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objetos) + 1, inicio_xref))
+    with open(ruta, "wb") as f:
+        f.write(salida.getvalue())
+
+def paginar(lineas):
+    return [lineas[i:i + LINEAS_POR_PAGINA] for i in range(0, len(lineas), LINEAS_POR_PAGINA)] or [[]]
+
+# --- GENERADORES DE GUÍAS Y FORMULARIOS SINTÉTICOS ---
+def guia_fedex(tracking, fecha, fmm, factura, azar):
+    t = tracking
+    return [
+        f"ORIGIN ID:BOGA (601) 555-{azar.randint(1000, 9999)} SHIP DATE: {fecha.strftime('%d%b%y').upper()}",
+        "SOLIDEO S.A.S. ZONA FRANCA BOGOTA", "ACTWGT: 2.50 KG", "BILL SENDER",
+        "TO ACME CORP (US) FEDEX INTERNATIONAL PRIORITY",
+        f"TRK# {t[:4]} {t[4:8]} {t[8:]}", f"INV: {factura} PN: {azar.randint(1, 40)},{azar.randint(0, 9)} FMM: {fmm}",
+    ]
+
+def guia_dhl(tracking, fecha, fmm, factura, azar):
+    t = tracking
+    return [
+        "EXPRESS WORLDWIDE", f"{fecha.isoformat()} MyDHL+ 1.0 / *30-0821*", "From: SOLIDEO SAS Bogota",
+        "To: TOKYO TRADING (JP)", f"Ref: #{azar.randint(1000000, 9999999)}",
+        f"WAYBILL {t[:2]} {t[2:6]} {t[6:]}", f"INV {factura} FMM {fmm} PN 1.{azar.randint(0, 9)}",
+    ]
+
+def guia_ups(tracking, fecha, fmm, factura, azar):
+    return [
+        f"UPS WORLDWIDE SERVICE {tracking}", f"SHIPPER SOLIDEO S.A.S. Date {fecha.day} {fecha.strftime('%b').upper()} {fecha.year}",
+        "SHIP TO: ACME CORP UNITED STATES OF AMERICA", f"INV: {factura}", f"PN: {azar.randint(1, 9)}.5 FMM No. {fmm}",
+    ]
+
+def generar_lote(directorio, cantidad, paginas_items, semilla=1):
+    # Devuelve las rutas de guías y formularios de un lote de `cantidad` guías
+    azar = random.Random(semilla)
+    os.makedirs(directorio, exist_ok=True)
+    base = date(2024, 3, 1)
+    guias = []
+    for i in range(cantidad):
+        operador = ("FedEx", "FedEx", "DHL", "UPS")[i % 4]
+        tracking = {"FedEx": f"77{i:010d}", "DHL": f"{i:010d}", "UPS": f"COJE{i:010d}"}[operador]
+        fmm = str(100000 + i // GUIAS_POR_FORMULARIO)
+        guias.append((operador, tracking, base + timedelta(days=i % 28), fmm, f"ZFFV{1000 + i // GUIAS_POR_FORMULARIO}"))
+
+    rutas_guias = []
+    for operador, generador in (("FedEx", guia_fedex), ("DHL", guia_dhl)):
+        paginas = [generador(t, f, fmm, fac, azar) for op, t, f, fmm, fac in guias if op == operador]
+        if paginas:
+            ruta = os.path.join(directorio, f"guias_{operador.lower()}.pdf")
+            escribir_pdf(ruta, paginas)
+            rutas_guias.append(ruta)
+    # UPS: una guía por archivo
+    for op, t, f, fmm, fac in guias:
+        if op != "UPS": continue
+        ruta = os.path.join(directorio, f"guia_ups_{t}.pdf")
+        escribir_pdf(ruta, [guia_ups(t, f, fmm, fac, azar)])
+        rutas_guias.append(ruta)
+
+    rutas_formularios = []
+    for n in range(0, cantidad, GUIAS_POR_FORMULARIO):
+        grupo = guias[n:n + GUIAS_POR_FORMULARIO]
+        encabezado = [
+            f"FORMULARIO No. No. {grupo[0][3]}", "1. USUARIO: SOLIDEO S.A.S.",
+            "22. País Destino: 249 UNITED STATES OF AMERICA", "TIPO DE OPERACIÓN: SALIDA AL EXTERIOR",
+        ]
+        items = [f"{k + 1} SUBPARTIDA 8471300000 DESCRIPCION MERCANCIA {k} 12 UN 127 KG"
+                 for k in range(paginas_items * LINEAS_POR_PAGINA)]
+        anexos = [
+            "DETALLE DE LOS ANEXOS",
+            f"6 FACTURA COMERCIAL ZFFE{grupo[0][3]} 2024/03/01 ANULADA",
+            f"6 FACTURA COMERCIAL {grupo[0][4]} 2024/03/01",
+        ]
+        for op, t, f, fmm, fac in grupo:
+            # ~5% de guías sin anexo y ~5% con fecha distinta para ejercitar todos los estados
+            sorteo = azar.random()
+            if sorteo < 0.05: continue
+            fecha = f + timedelta(days=1) if sorteo < 0.10 else f
+            numero = f"{t[:4]} {t[4:8]} {t[8:]}" if op == "FedEx" else t
+            anexos.append(f"127 GUIAS DE TRAFICO POSTAL {numero} {fecha.strftime('%Y/%m/%d')}")
+        ruta = os.path.join(directorio, f"formulario_{grupo[0][3]}.pdf")
+        escribir_pdf(ruta, paginar(encabezado) + paginar(items)[:paginas_items] + paginar(anexos))
+        rutas_formularios.append(ruta)
+    return rutas_guias, rutas_formularios
+
+# --- MEDICIÓN POR ETAPAS ---
+def medir(funcion, repeticiones):
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        resultado = funcion()
+        tiempos.append(time.perf_counter() - inicio)
+    return min(tiempos), sorted(tiempos)[len(tiempos) // 2], resultado
+
+def medir_lote(rutas_guias, rutas_formularios, repeticiones):
+    etapas = []
+    def registrar(etapa, funcion, contar=len):
+        minimo, mediana, resultado = medir(funcion, repeticiones)
+        etapas.append({"etapa": etapa, "segundos_min": round(minimo, 6), "segundos_mediana": round(mediana, 6),
+                       "elementos": contar(resultado)})
+        return resultado
+
+    textos = registrar("texto_guias", lambda: [leer_texto_guias(r) for r in rutas_guias])
+    datos_guias = registrar("campos_guias", lambda: [reg for t in textos for reg in analizar_texto_guias(t)])
+    lineas = registrar("texto_formularios", lambda: [leer_lineas_formulario(r) for r in rutas_formularios],
+                       lambda r: sum(map(len, r)))
+    registrar("texto_formularios_dirigido", lambda: [leer_lineas_formulario_dirigido(r) for r in rutas_formularios],
+              lambda r: sum(map(len, r)))
+    datos_formularios = registrar("campos_formularios", lambda: [reg for l in lineas for reg in analizar_lineas_formulario(l)])
+
+    df_guias = guias_a_dataframe(datos_guias).drop_duplicates(subset=['Tracking'], keep='first')
+    df_formularios = formularios_a_dataframe(datos_formularios)
+    df_unido = registrar("union", lambda: unir_registros(df_guias, df_formularios))
+    df_conciliado = registrar("estados", lambda: clasificar_conciliacion(df_unido.copy()))
+
+    for formato in FORMATOS_EXPORTACION:
+        registrar(f"exportacion_{formato.lower()}", lambda: exportar(df_conciliado, formato))
+    return etapas
+
+def metadatos():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        commit = ""
+    return {
+        "fecha": datetime.now().isoformat(timespec="seconds"),
+        "commit": commit,
+        "python": platform.python_version(),
+        "plataforma": platform.platform(),
+        "cpus": os.cpu_count(),
+        "pandas": pd.__version__,
+        "version_parser": extraccion.VERSION_PARSER,
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark de extracción y conciliación con PDFs sintéticos")
+    parser.add_argument("--tamanos", type=int, nargs="+", default=[50, 200, 1000], help="Número de guías por lote")
+    parser.add_argument("--paginas-items", type=int, default=5, help="Páginas de ítems por formulario FMM")
+    parser.add_argument("--repeticiones", type=int, default=1, help="Repeticiones por etapa (se reporta mínimo y mediana)")
+    parser.add_argument("--salida", default="benchmark_resultados.json", help="Archivo JSON de resultados")
+    parser.add_argument("--directorio", default=None, help="Directorio para los PDFs generados (por defecto, temporal)")
+    args = parser.parse_args(argv)
+
+    resultados = []
+    with tempfile.TemporaryDirectory() as temporal:
+        for cantidad in args.tamanos:
+            directorio = os.path.join(args.directorio or temporal, f"lote_{cantidad}")
+            rutas_guias, rutas_formularios = generar_lote(directorio, cantidad, args.paginas_items)
+            for etapa in medir_lote(rutas_guias, rutas_formularios, args.repeticiones):
+                etapa = {"tamano": cantidad, **etapa}
+                resultados.append(etapa)
+                print(f"{cantidad:>7} {etapa['etapa']:<28} {etapa['segundos_min']:>10.4f}s {etapa['elementos']:>8}")
+
+    with open(args.salida, "w", encoding="utf-8") as f:
+        json.dump({"metadatos": metadatos(), "parametros": vars(args), "resultados": resultados}, f,
+                  ensure_ascii=False, indent=2)
+    print(f"Resultados guardados en {args.salida}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,150 @@
+# Benchmark de arranque y de reruns de la app de Streamlit (sin navegador, con AppTest).
+#
+#   python benchmark_app.py --filas 1000 100000 --repeticiones 5 --salida benchmark_app.json
+#
+# Arranque en frío: un intérprete nuevo dibuja la pantalla de carga (primer pintado) y se
+# anotan los módulos pesados que ya se importaron. Reruns: con resultados sintéticos de N filas
+# se mide un rerun sin cambios y los clics habituales (filtros por diferencias y por estado,
+# búsqueda de tracking, página siguiente, formato de exportación). Los resultados se guardan en JSON para comparar ejecuciones.
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import subprocess
+from datetime import datetime
+from esquema import ESTADO_SOLO_GUIA
+
+RUTA_APP = os.path.join(os.path.dirname(os.path.abspath(__file__)), "app.py")
+MODULOS_PESADOS = ("pandas", "numpy", "pyarrow", "pdfplumber", "xlsxwriter", "openpyxl")
+
+# Se ejecuta en un intérprete nuevo para medir las importaciones en frío
+_ARRANQUE = """
+import sys, time, json
+inicio = time.perf_counter()
+from streamlit.testing.v1 import AppTest
+streamlit_listo = time.perf_counter()
+at = AppTest.from_file(sys.argv[1], default_timeout=120).run()
+primer_pintado = time.perf_counter()
+at.run()
+rerun = time.perf_counter()
+print(json.dumps({
+    "importar_streamlit": streamlit_listo - inicio,
+    "primer_pintado": primer_pintado - streamlit_listo,
+    "rerun": rerun - primer_pintado,
+    "modulos": [m for m in sys.argv[2:] if m in sys.modules],
+    "excepciones": [str(e.value) for e in at.exception],
+}))
+"""
+
+def medir_arranque(repeticiones):
+    # Sin la precarga en segundo plano, para ver solo lo que importa el primer pintado
+    entorno = {**os.environ, "CONCILIACION_PRECARGA": "0"}
+    muestras = []
+    for _ in range(repeticiones):
+        salida = subprocess.run([sys.executable, "-c", _ARRANQUE, RUTA_APP, *MODULOS_PESADOS],
+                                capture_output=True, text=True, check=True, env=entorno)
+        muestras.append(json.loads(salida.stdout.strip().splitlines()[-1]))
+    etapas = []
+    for etapa in ("importar_streamlit", "primer_pintado", "rerun"):
+        tiempos = sorted(m[etapa] for m in muestras)
+        etapas.append({"etapa": f"arranque_{etapa}", "segundos_min": round(tiempos[0], 6),
+                       "segundos_mediana": round(tiempos[len(tiempos) // 2], 6)})
+    return etapas, muestras[-1]["modulos"], muestras[-1]["excepciones"]
+
+def resultados_sinteticos(filas, semilla=1):
+    # Conciliación de guías y formularios aleatorios con una mezcla realista de estados
+    from conciliacion import conciliar
+    from registros import formularios_a_dataframe, guias_a_dataframe
+    azar = random.Random(semilla)
+    paises = ["US", "UNITED STATES OF AMERICA", "JP", "JAPAN", "MEXICO"]
+    guias, formularios = [], []
+    for i in range(filas):
+        tracking, fecha, fmm = f"{770000000000 + i}", f"2024-03-{azar.randint(10, 28)}", f"{azar.randint(100000, 100500)}"
+        if azar.random() < 0.9:
+            guias.append({"Tracking": tracking, "Fecha_Guia": fecha, "Pais_Destino_Guia": azar.choice(paises),
+                          "Peso_Neto_Guia": f"{azar.uniform(1, 50):.2f}", "FMM_Guia": fmm,
+                          "Remitente_Usuario_Guia": "SOLIDEO S.A.S.", "Facturas_Guia": f"ZFFV{i}"})
+        if azar.random() < 0.9:
+            formularios.append({"Tracking": tracking, "Fecha_FMM": fecha if azar.random() < 0.8 else "2024-03-01",
+                                "Pais_Destino_FMM": azar.choice(paises), "FMM_Formulario": fmm,
+                                "Remitente_Usuario_FMM": "SOLIDEO S.A.S.", "Facturas_FMM": f"ZFFV{i}"})
+    return conciliar(guias_a_dataframe(guias), formularios_a_dataframe(formularios))
+
+def medir_reruns(filas, repeticiones):
+    from streamlit.testing.v1 import AppTest
+    at = AppTest.from_file(RUTA_APP, default_timeout=300)
+    at.session_state["resultados"] = resultados_sinteticos(filas)
+    at.session_state["version_resultados"] = 1
+    at.run()
+    clics = {
+        "rerun_sin_cambios": lambda: at.run(),
+        "filtro_diferencias": lambda: at.multiselect(key="filtro_campos").set_value(["Fecha"]).run(),
+        "quitar_filtro": lambda: at.multiselect(key="filtro_campos").set_value([]).run(),
+        "filtro_estado": lambda: at.multiselect(key="filtro_estados").set_value([ESTADO_SOLO_GUIA]).run(),
+        "quitar_filtro_estado": lambda: at.multiselect(key="filtro_estados").set_value([]).run(),
+        "buscar_tracking": lambda: at.text_input(key="filtro_tracking").set_value("7700000012").run(),
+        "quitar_busqueda": lambda: at.text_input(key="filtro_tracking").set_value("").run(),
+        "pagina_siguiente": lambda: at.number_input(key="pagina_resultados").increment().run(),
+        "formato_csv": lambda: at.radio[0].set_value("CSV").run(),
+        "formato_excel": lambda: at.radio[0].set_value("Excel").run(),
+    }
+    etapas = []
+    for etapa, clic in clics.items():
+        tiempos = []
+        for _ in range(repeticiones):
+            inicio = time.perf_counter()
+            clic()
+            tiempos.append(time.perf_counter() - inicio)
+            if at.exception: raise RuntimeError(f"{etapa}: {at.exception[0].value}")
+        tiempos.sort()
+        etapas.append({"etapa": etapa, "segundos_min": round(tiempos[0], 6),
+                       "segundos_mediana": round(tiempos[len(tiempos) // 2], 6)})
+    return etapas
+
+def metadatos():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                cwd=os.path.dirname(RUTA_APP)).stdout.strip()
+    except OSError:
+        commit = ""
+    import streamlit
+    return {
+        "fecha": datetime.now().isoformat(timespec="seconds"),
+        "commit": commit,
+        "python": platform.python_version(),
+        "plataforma": platform.platform(),
+        "cpus": os.cpu_count(),
+        "streamlit": streamlit.__version__,
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark de arranque y de reruns de la app de Streamlit")
+    parser.add_argument("--filas", type=int, nargs="+", default=[1000, 100000], help="Filas de resultados para los reruns")
+    parser.add_argument("--repeticiones", type=int, default=5, help="Repeticiones por medida (se reporta mínimo y mediana)")
+    parser.add_argument("--salida", default="benchmark_app.json", help="Archivo JSON de resultados")
+    args = parser.parse_args(argv)
+
+    resultados = []
+    etapas, modulos, excepciones = medir_arranque(args.repeticiones)
+    for etapa in etapas:
+        resultados.append({"filas": 0, **etapa})
+        print(f"{0:>7} {etapa['etapa']:<28} {etapa['segundos_min']:>10.4f}s {etapa['segundos_mediana']:>10.4f}s")
+    print(f"Módulos pesados en el primer pintado: {', '.join(modulos) or 'ninguno'}")
+    for excepcion in excepciones:
+        print(f"Excepción en el arranque: {excepcion}")
+    for filas in args.filas:
+        for etapa in medir_reruns(filas, args.repeticiones):
+            resultados.append({"filas": filas, **etapa})
+            print(f"{filas:>7} {etapa['etapa']:<28} {etapa['segundos_min']:>10.4f}s {etapa['segundos_mediana']:>10.4f}s")
+
+    with open(args.salida, "w", encoding="utf-8") as f:
+        json.dump({"metadatos": metadatos(), "parametros": vars(args), "modulos_primer_pintado": modulos,
+                   "resultados": resultados}, f, ensure_ascii=False, indent=2)
+    print(f"Resultados guardados en {args.salida}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
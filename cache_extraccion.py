@@ -0,0 +1,121 @@
+import os
+import json
+import hashlib
+import tempfile
+import threading
+
+# Caché en disco de texto y registros extraídos, direccionada por el contenido del PDF.
+# Las entradas se guardan como JSON (no pickle) porque el directorio puede ser compartido.
+DIRECTORIO_POR_DEFECTO = os.environ.get(
+    "CONCILIACION_CACHE_DIR", os.path.join(tempfile.gettempdir(), "conciliacion_cache")
+)
+MAX_MB_POR_DEFECTO = int(os.environ.get("CONCILIACION_CACHE_MB", "512"))
+
+def hash_contenido(archivo, prefijo=""):
+    h = hashlib.sha256(prefijo.encode("utf-8"))
+    if isinstance(archivo, (str, os.PathLike)):
+        with open(archivo, "rb") as f:
+            for bloque in iter(lambda: f.read(1 << 20), b""):
+                h.update(bloque)
+    elif isinstance(archivo, bytes):
+        h.update(archivo)
+    elif hasattr(archivo, "getvalue"):
+        h.update(archivo.getvalue())
+    else:
+        archivo.seek(0)
+        h.update(archivo.read())
+        archivo.seek(0)
+    return h.hexdigest()
+
+class CacheExtraccion:
+    def __init__(self, directorio=DIRECTORIO_POR_DEFECTO, max_mb=MAX_MB_POR_DEFECTO):
+        self.directorio = directorio
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.aciertos = 0
+        self.fallos = 0
+        self.desalojos = 0
+        self._lock = threading.Lock()
+        os.makedirs(directorio, exist_ok=True)
+        self._bytes = sum(tam for _, _, tam in self._entradas())
+
+    def _ruta(self, clave):
+        return os.path.join(self.directorio, clave + ".json")
+
+    def _entradas(self):
+        entradas = []
+        for nombre in os.listdir(self.directorio):
+            if not nombre.endswith(".json"): continue
+            try:
+                info = os.stat(os.path.join(self.directorio, nombre))
+            except OSError:
+                continue
+            entradas.append((info.st_mtime, nombre, info.st_size))
+        return entradas
+
+    def obtener(self, clave):
+        ruta = self._ruta(clave)
+        try:
+            with open(ruta, "r", encoding="utf-8") as f:
+                entrada = json.load(f)
+            # Marcar como usada recientemente (LRU por fecha de modificación)
+            os.utime(ruta)
+        except (OSError, ValueError):
+            with self._lock: self.fallos += 1
+            return None
+        with self._lock: self.aciertos += 1
+        return entrada
+
+    def guardar(self, clave, entrada):
+        ruta = self._ruta(clave)
+        fd, temporal = tempfile.mkstemp(dir=self.directorio, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(entrada, f, ensure_ascii=False)
+            tam = os.path.getsize(temporal)
+            # Al sobrescribir una entrada (nuevo VERSION_PARSER) solo cuenta la diferencia de tamaño
+            try:
+                anterior = os.path.getsize(ruta)
+            except OSError:
+                anterior = 0
+            os.replace(temporal, ruta)
+        except OSError:
+            if os.path.exists(temporal): os.remove(temporal)
+            return
+        with self._lock:
+            self._bytes += tam - anterior
+            if self._bytes > self.max_bytes:
+                self._desalojar()
+
+    def _desalojar(self):
+        # Recalcular desde disco: otros procesos pueden compartir el directorio
+        entradas = sorted(self._entradas())
+        total = sum(tam for _, _, tam in entradas)
+        objetivo = int(self.max_bytes * 0.9)
+        for _, nombre, tam in entradas:
+            if total <= objetivo: break
+            try:
+                os.remove(os.path.join(self.directorio, nombre))
+                self.desalojos += 1
+            except OSError:
+                pass
+            total -= tam
+        self._bytes = total
+
+    def vaciar(self):
+        with self._lock:
+            for _, nombre, _ in self._entradas():
+                try: os.remove(os.path.join(self.directorio, nombre))
+                except OSError: pass
+            self._bytes = 0
+
+    def estadisticas(self):
+        with self._lock:
+            consultas = self.aciertos + self.fallos
+            return {
+                "aciertos": self.aciertos,
+                "fallos": self.fallos,
+                "tasa_aciertos": self.aciertos / consultas if consultas else 0.0,
+                "desalojos": self.desalojos,
+                "entradas": len(self._entradas()),
+                "megabytes": self._bytes / (1024 * 1024),
+            }
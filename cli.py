@@ -0,0 +1,165 @@
+# Conciliación por lotes sin Streamlit, pensada para ejecuciones programadas (cron).
+#
+#   python cli.py --guias "guias/*.pdf" --formularios formularios/ --salida conciliacion.xlsx
+#   python cli.py --guias etiquetas_fedex.zip etiquetas_dhl.zip --formularios formularios/ --salida conciliacion.xlsx
+#
+# Con --almacen los registros se acumulan en un histórico SQLite y se concilia toda la
+# ventana abierta (opcionalmente acotada con --desde/--hasta); los trackings OK se cierran.
+#
+# Código de salida: 0 si todo está OK, 1 si hay diferencias o trackings sin pareja,
+# 2 si no se pudo completar la conciliación.
+import os
+import sys
+import glob
+import logging
+import argparse
+from extraccion import WORKERS_POR_DEFECTO, procesar_archivos_guias_pdf, procesar_formularios_pdf
+from conciliacion import ESTADO_OK, clasificar_conciliacion, unir_registros
+from cache_extraccion import DIRECTORIO_POR_DEFECTO, CacheExtraccion
+from rendimiento import RegistroRendimiento
+from registros import formularios_a_dataframe
+from exportacion import FORMATO_POR_EXTENSION, escribir
+from almacen_trackings import RETENCION_DIAS_POR_DEFECTO, AlmacenTrackings
+from sugerencias import sugerir_pares
+
+logger = logging.getLogger(__name__)
+
+SALIDA_OK = 0
+SALIDA_DIFERENCIAS = 1
+SALIDA_ERROR = 2
+
+EXTENSIONES_ENTRADA = (".pdf", ".zip")
+
+def resolver_entradas(patrones):
+    # Acepta directorios (se toman sus PDF y ZIP), rutas y patrones glob; conserva el orden sin repetir.
+    # Los ZIP se expanden al extraer y los PDF con el mismo contenido se leen una sola vez
+    rutas = []
+    for patron in patrones:
+        if os.path.isdir(patron):
+            encontrados = [os.path.join(patron, n) for n in os.listdir(patron)]
+        else:
+            encontrados = glob.glob(patron)
+        # Solo PDF y ZIP: un patrón como "*" no debe mandar otros archivos a la extracción
+        encontrados = [r for r in encontrados if r.lower().endswith(EXTENSIONES_ENTRADA) and os.path.isfile(r)]
+        for ruta in sorted(encontrados):
+            if ruta not in rutas: rutas.append(ruta)
+    return rutas
+
+FORMATOS_SALIDA = tuple(FORMATO_POR_EXTENSION)
+
+def guardar_resultados(df, ruta, por_estado=False):
+    extension = os.path.splitext(ruta)[1].lower()
+    if extension not in FORMATO_POR_EXTENSION:
+        raise ValueError(f"Formato de salida no soportado: {extension or ruta}")
+    escribir(df, FORMATO_POR_EXTENSION[extension], ruta, por_estado)
+
+def crear_parser():
+    parser = argparse.ArgumentParser(description="Conciliación de guías aéreas y formularios FMM en PDF")
+    parser.add_argument("--guias", nargs="+", required=True, help="Directorios, rutas o patrones glob de guías (PDF o ZIP)")
+    parser.add_argument("--formularios", nargs="+", required=True, help="Directorios, rutas o patrones glob de formularios (PDF o ZIP)")
+    parser.add_argument("--salida", required=True, help="Archivo de resultados (.csv, .parquet o .xlsx)")
+    parser.add_argument("--hojas-por-estado", action="store_true",
+                        help="En .xlsx, añadir una hoja por estado (OK, diferencias, solo guía, solo FMM)")
+    parser.add_argument("--workers", type=int, default=WORKERS_POR_DEFECTO, help="Procesos de extracción en paralelo")
+    parser.add_argument("--por-paginas", action="store_true", help="Leer las guías página a página (PDF muy grandes)")
+    parser.add_argument("--formularios-completos", action="store_true",
+                        help="Extraer todas las páginas de los formularios en lugar de solo las relevantes")
+    parser.add_argument("--sin-cache", action="store_true", help="No usar la caché de extracción")
+    parser.add_argument("--cache-dir", default=DIRECTORIO_POR_DEFECTO, help="Directorio de la caché de extracción")
+    parser.add_argument("--rendimiento", help="Guardar tiempos por etapa y por archivo en este JSON")
+    parser.add_argument("--almacen", help="Histórico SQLite: guarda los registros y concilia toda la ventana abierta")
+    parser.add_argument("--desde", help="Fecha inicial (AAAA-MM-DD) de la ventana del histórico")
+    parser.add_argument("--hasta", help="Fecha final (AAAA-MM-DD) de la ventana del histórico")
+    parser.add_argument("--retencion-dias", type=int, default=RETENCION_DIAS_POR_DEFECTO,
+                        help="Días que se conservan los trackings cerrados en el histórico")
+    parser.add_argument("--sugerencias",
+                        help="Guardar en este archivo (.csv, .parquet o .xlsx) posibles parejas de trackings sin coincidencia")
+    parser.add_argument("-v", "--verbose", action="store_true", help="Mostrar mensajes de depuración")
+    return parser
+
+def main(argv=None):
+    args = crear_parser().parse_args(argv)
+    logging.basicConfig(
+        level=logging.DEBUG if args.verbose else logging.INFO,
+        format="%(asctime)s %(levelname)s %(name)s: %(message)s"
+    )
+
+    for salida in filter(None, (args.salida, args.sugerencias)):
+        if os.path.splitext(salida)[1].lower() not in FORMATOS_SALIDA:
+            logger.error(f"Formato de salida no soportado: {salida} (usa {', '.join(FORMATOS_SALIDA)})")
+            return SALIDA_ERROR
+
+    archivos_guias = resolver_entradas(args.guias)
+    archivos_formularios = resolver_entradas(args.formularios)
+    # Con histórico basta con uno de los dos lados: la contraparte puede llegar otro día
+    if not (archivos_guias or archivos_formularios) if args.almacen else not (archivos_guias and archivos_formularios):
+        logger.error("Debes indicar guías y formularios PDF existentes")
+        return SALIDA_ERROR
+
+    cache = None if args.sin_cache else CacheExtraccion(args.cache_dir)
+    rendimiento = RegistroRendimiento()
+    try:
+        with rendimiento.etapa("extraccion_guias", archivos=len(archivos_guias)) as datos:
+            df_guias = procesar_archivos_guias_pdf(archivos_guias, logger.error, args.workers, cache, args.por_paginas,
+                                                   rendimiento)
+            datos["registros"] = len(df_guias)
+        logger.info(f"Guías procesadas: {len(df_guias)}")
+        with rendimiento.etapa("extraccion_formularios", archivos=len(archivos_formularios)) as datos:
+            datos_formularios = procesar_formularios_pdf(archivos_formularios, logger.error, args.workers, cache,
+                                                         not args.formularios_completos, rendimiento)
+            df_formularios = formularios_a_dataframe(datos_formularios)
+            datos["registros"] = len(df_formularios)
+        logger.info(f"Guías procesadas en el formulario: {len(df_formularios)}")
+
+        if args.almacen:
+            # Concilia contra todo lo abierto en el histórico, no solo contra los archivos de hoy
+            almacen = AlmacenTrackings(args.almacen)
+            with rendimiento.etapa("almacen_guardar"):
+                almacen.guardar(df_guias, df_formularios)
+            with rendimiento.etapa("almacen_ventana") as datos:
+                df_conciliado = almacen.conciliar_ventana(args.desde, args.hasta)
+                datos["registros"] = 0 if df_conciliado is None else len(df_conciliado)
+            if df_conciliado is None:
+                logger.error("No hay trackings abiertos en la ventana indicada")
+                return SALIDA_ERROR
+            with rendimiento.etapa("almacen_cierre") as datos:
+                datos["cerrados"] = almacen.cerrar(df_conciliado)
+                datos["depurados"] = almacen.depurar(args.retencion_dias)
+            logger.info(f"Histórico: {datos['cerrados']} trackings cerrados, {datos['depurados']} registros depurados, "
+                        f"{almacen.estadisticas()}")
+        elif df_guias.empty or df_formularios.empty:
+            logger.error("No se pudieron extraer datos suficientes para comparar")
+            return SALIDA_ERROR
+        else:
+            with rendimiento.etapa("union"):
+                df_unido = unir_registros(df_guias, df_formularios)
+            with rendimiento.etapa("estados"):
+                df_conciliado = clasificar_conciliacion(df_unido)
+        with rendimiento.etapa("exportacion", registros=len(df_conciliado)):
+            guardar_resultados(df_conciliado, args.salida, args.hojas_por_estado)
+        if args.sugerencias:
+            with rendimiento.etapa("sugerencias") as datos:
+                sugerencias = sugerir_pares(df_conciliado)
+                datos["registros"] = len(sugerencias)
+                guardar_resultados(sugerencias, args.sugerencias)
+            logger.info(f"Posibles parejas de trackings sin coincidencia: {len(sugerencias)} en {args.sugerencias}")
+    except Exception as e:
+        logger.error(f"Error en procesamiento: {e}")
+        return SALIDA_ERROR
+    finally:
+        if args.rendimiento:
+            with open(args.rendimiento, "w", encoding="utf-8") as f:
+                f.write(rendimiento.como_json())
+
+    conteo_estados = df_conciliado['Estado_Conciliacion'].value_counts()
+    conteo_estados = conteo_estados[conteo_estados > 0]
+    for estado, cantidad in conteo_estados.items():
+        logger.info(f"{estado}: {cantidad}")
+    if cache is not None:
+        logger.info(f"Caché de extracción: {cache.estadisticas()}")
+    logger.info(f"Resultados guardados en {args.salida}")
+
+    return SALIDA_OK if conteo_estados.get(ESTADO_OK, 0) == len(df_conciliado) else SALIDA_DIFERENCIAS
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,93 @@
+import numpy as np
+import pandas as pd
+from esquema import (
+    CAMPOS_COMPARADOS, COLUMNAS_DIFERENCIA, COLUMNAS_FMM, COLUMNAS_GUIA, ESTADO_OK, ESTADO_SOLO_FMM, ESTADO_SOLO_GUIA,
+    PREFIJO_DIFERENCIAS
+)
+
+# --- MAPEO DE PAÍSES ---
+MAPA_PAISES = {
+    "US": "UNITED STATES OF AMERICA", 
+    "ESTADOS UNIDOS": "UNITED STATES OF AMERICA", 
+    "JP": "JAPAN"
+}
+
+# Estado para cada combinación de campos distintos (bit i = campo i de CAMPOS_COMPARADOS)
+_ESTADOS_POR_MASCARA = np.array([
+    ESTADO_OK if mascara == 0 else
+    f'{PREFIJO_DIFERENCIAS} {", ".join(etiqueta for i, (_, _, etiqueta, _) in enumerate(CAMPOS_COMPARADOS) if mascara >> i & 1)}'
+    for mascara in range(1 << len(CAMPOS_COMPARADOS))
+], dtype=object)
+# Estado_Conciliacion es categórica: código = máscara de diferencias, o uno de los dos huérfanos
+CATEGORIAS_ESTADO = [*_ESTADOS_POR_MASCARA, ESTADO_SOLO_GUIA, ESTADO_SOLO_FMM]
+_CODIGO_SOLO_GUIA = len(_ESTADOS_POR_MASCARA)
+_CODIGO_SOLO_FMM = _CODIGO_SOLO_GUIA + 1
+
+def normalizar_pais(serie):
+    if isinstance(serie.dtype, pd.CategoricalDtype):
+        # Solo se normalizan las categorías distintas y se reasignan los códigos
+        normalizadas = normalizar_pais(pd.Series(serie.cat.categories, dtype=object))
+        categorias = pd.Index(normalizadas.unique())
+        codigos = np.append(categorias.get_indexer(normalizadas), -1)
+        return pd.Series(pd.Categorical.from_codes(codigos[serie.cat.codes.to_numpy()], categorias), index=serie.index)
+    mayusculas = serie.str.upper()
+    return mayusculas.map(MAPA_PAISES).fillna(mayusculas)
+
+def _como_texto(serie):
+    # Igual que str(valor) fila a fila: los valores faltantes se comparan como 'nan'
+    return serie.astype(object).where(serie.notna(), 'nan').astype(str)
+
+def _distintos(serie_guia, serie_fmm):
+    # Las fechas datetime64 se comparan directamente (dos NaT son iguales, como dos textos vacíos)
+    if pd.api.types.is_datetime64_any_dtype(serie_guia) and pd.api.types.is_datetime64_any_dtype(serie_fmm):
+        return ((serie_guia != serie_fmm) & ~(serie_guia.isna() & serie_fmm.isna())).to_numpy()
+    # Si solo una es datetime64 (la otra quedó como texto) se compara como el texto extraído
+    serie_guia, serie_fmm = (
+        s.dt.strftime('%Y-%m-%d').fillna('') if pd.api.types.is_datetime64_any_dtype(s) else s
+        for s in (serie_guia, serie_fmm)
+    )
+    return (_como_texto(serie_guia) != _como_texto(serie_fmm)).to_numpy()
+
+def calcular_estados(df_conciliado):
+    # Compara todas las filas a la vez y añade las columnas Dif_* y Estado_Conciliacion
+    origen = df_conciliado['_merge']
+    en_ambos = (origen == 'both').to_numpy()
+    mascara = np.zeros(len(df_conciliado), dtype=np.int64)
+    
+    for i, (col_guia, col_fmm, _, col_dif) in enumerate(CAMPOS_COMPARADOS):
+        distinto = _distintos(df_conciliado[col_guia], df_conciliado[col_fmm]) & en_ambos
+        df_conciliado[col_dif] = distinto
+        mascara |= distinto.astype(np.int64) << i
+    
+    mascara[(origen == 'left_only').to_numpy()] = _CODIGO_SOLO_GUIA
+    mascara[(origen == 'right_only').to_numpy()] = _CODIGO_SOLO_FMM
+    df_conciliado['Estado_Conciliacion'] = pd.Categorical.from_codes(mascara, CATEGORIAS_ESTADO)
+    return df_conciliado
+
+def unir_registros(df_guias, df_formularios):
+    # Conciliación con verificación real de datos
+    return pd.merge(
+        df_guias, 
+        df_formularios, 
+        on='Tracking', 
+        how='outer', 
+        indicator=True,
+        suffixes=('_Guia', '_FMM')
+    )
+
+def clasificar_conciliacion(df_conciliado):
+    df_conciliado['Pais_Normalizado_Guia'] = normalizar_pais(df_conciliado['Pais_Destino_Guia'])
+    df_conciliado['Pais_Normalizado_FMM'] = normalizar_pais(df_conciliado['Pais_Destino_FMM'])
+    
+    df_conciliado = calcular_estados(df_conciliado)
+    
+    # ELIMINAR columna _merge (ya no es necesaria)
+    df_conciliado = df_conciliado.drop(columns=['_merge'], errors='ignore')
+    
+    # Reiniciar índice para que empiece en 1
+    df_conciliado.reset_index(drop=True, inplace=True)
+    df_conciliado.index = df_conciliado.index + 1
+    return df_conciliado
+
+def conciliar(df_guias, df_formularios):
+    return clasificar_conciliacion(unir_registros(df_guias, df_formularios))
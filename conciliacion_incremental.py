@@ -0,0 +1,121 @@
+import numpy as np
+import pandas as pd
+from conciliacion import COLUMNAS_FMM, COLUMNAS_GUIA, conciliar
+from registros import concatenar, formularios_a_dataframe, guias_a_dataframe
+
+# Conciliación que se actualiza por archivo: al agregar o quitar un PDF solo se recalculan
+# las filas de los trackings que contiene. El resultado es el mismo que conciliar() sobre
+# todos los registros (guías sin duplicados, la primera por orden de carga gana).
+# Los registros de cada archivo se guardan como DataFrame tipado (no como dicts de texto):
+# la sesión vive en el proceso del servidor mientras la pestaña siga abierta.
+# Un archivo puede traer sus partes (por PDF, ver extraccion.extraer_por_archivo): las filas de un
+# contenido ya cargado por otro archivo se guardan pero no cuentan, y pasan a contar en el siguiente
+# archivo que lo tenga (por orden de carga) cuando se quita el primero.
+def _en(trackings, claves):
+    # Como Series.isin, con la tabla hash del índice `claves` construida una sola vez
+    return claves.get_indexer(trackings) >= 0
+
+class _ArchivosCargados(dict):
+    # {id_archivo: DataFrame con las filas que cuentan}, en orden de carga
+    def __init__(self):
+        super().__init__()
+        self._completos = {}  # {id_archivo: (DataFrame con todas sus filas, partes o None)}
+        self._duenos = {}     # {huella: id_archivo cuyas filas de ese contenido cuentan}
+
+    def _activar(self, id_archivo):
+        df, partes = self._completos[id_archivo]
+        if partes is None:
+            self[id_archivo] = df
+            return
+        cuentan = np.repeat([self._duenos[huella] == id_archivo for huella, _ in partes], [n for _, n in partes])
+        self[id_archivo] = df if cuentan.all() else df[cuentan]
+
+    def agregar(self, id_archivo, df, partes=None):
+        # Volver a agregar un archivo lo pasa al final del orden de carga
+        afectados = self.quitar(id_archivo) if id_archivo in self else set()
+        self._completos[id_archivo] = (df, partes)
+        for huella, _ in partes or ():
+            self._duenos.setdefault(huella, id_archivo)
+        self._activar(id_archivo)
+        return afectados | set(self[id_archivo]['Tracking'])
+
+    def quitar(self, id_archivo):
+        afectados = set(self.pop(id_archivo)['Tracking'])
+        _, partes = self._completos.pop(id_archivo)
+        libres = {huella for huella, _ in partes or () if self._duenos.get(huella) == id_archivo}
+        for huella in libres:
+            del self._duenos[huella]
+        for otro, (_, partes_otro) in self._completos.items():
+            if not libres: break
+            propias = libres.intersection(huella for huella, _ in partes_otro or ())
+            if not propias: continue
+            for huella in propias:
+                self._duenos[huella] = otro
+            libres -= propias
+            self._activar(otro)
+            afectados |= set(self[otro]['Tracking'])
+        return afectados
+
+class ConciliacionIncremental:
+    def __init__(self):
+        # {id_archivo: DataFrame}; el orden del dict es el orden de carga
+        self.guias = _ArchivosCargados()
+        self.formularios = _ArchivosCargados()
+        self.resultados = None
+        self.total_guias = 0
+
+    @property
+    def total_formularios(self):
+        return sum(len(df) for df in self.formularios.values())
+
+    def _agregar(self, archivos, id_archivo, registros, a_dataframe):
+        registros, partes = registros if isinstance(registros, tuple) else (registros, None)
+        df = registros if isinstance(registros, pd.DataFrame) else a_dataframe(registros)
+        return archivos.agregar(id_archivo, df, partes)
+
+    def aplicar(self, guias_nuevas=(), guias_quitadas=(), formularios_nuevos=(), formularios_quitados=()):
+        # guias_nuevas / formularios_nuevos: pares (id_archivo, registros, DataFrame o (registros, partes));
+        # *_quitadas: ids de archivo. Devuelve el número de trackings recalculados.
+        afectados = set()
+        for id_archivo in guias_quitadas:
+            afectados |= self.guias.quitar(id_archivo)
+        for id_archivo in formularios_quitados:
+            afectados |= self.formularios.quitar(id_archivo)
+        for id_archivo, registros in guias_nuevas:
+            afectados |= self._agregar(self.guias, id_archivo, registros, guias_a_dataframe)
+        for id_archivo, registros in formularios_nuevos:
+            afectados |= self._agregar(self.formularios, id_archivo, registros, formularios_a_dataframe)
+
+        trackings_guias = [df['Tracking'] for df in self.guias.values() if len(df)]
+        self.total_guias = pd.concat(trackings_guias).nunique() if trackings_guias else 0
+        if not trackings_guias or not any(len(df) for df in self.formularios.values()):
+            self.resultados = None
+        elif self.resultados is None:
+            self.resultados = self._conciliar()
+        elif afectados:
+            self._actualizar_filas(afectados)
+        return len(afectados)
+
+    def _conciliar(self, claves=None):
+        # Los archivos se recorren en orden de carga: la primera guía gana y los formularios
+        # quedan en el mismo orden que al concatenar todos los archivos
+        def filas(archivos):
+            if claves is None or not archivos: return list(archivos.values())
+            # Una sola búsqueda sobre los trackings de todos los archivos, repartida luego por archivo
+            mascara = _en(np.concatenate([df['Tracking'].to_numpy(dtype=object) for df in archivos.values()]), claves)
+            limites = np.cumsum([0, *(len(df) for df in archivos.values())])
+            return [df[mascara[desde:hasta]] for df, desde, hasta in zip(archivos.values(), limites, limites[1:])
+                    if mascara[desde:hasta].any()]
+        df_guias = concatenar(filas(self.guias), COLUMNAS_GUIA).drop_duplicates(subset=['Tracking'], keep='first')
+        return conciliar(df_guias, concatenar(filas(self.formularios), COLUMNAS_FMM))
+
+    def _actualizar_filas(self, afectados):
+        claves = pd.Index(list(afectados), dtype=object)
+        parcial = self._conciliar(claves)
+        resto = self.resultados[~_en(self.resultados['Tracking'], claves)]
+        # El outer merge ordena por Tracking; el orden estable conserva el de las filas de cada tracking
+        # concatenar vuelve a categorizar y tipa igual las fechas de las dos partes
+        resultados = concatenar([resto, parcial], self.resultados.columns).sort_values('Tracking', kind='stable')
+        resultados.reset_index(drop=True, inplace=True)
+        resultados.index = resultados.index + 1
+        self.resultados = resultados
@@ -0,0 +1,21 @@
+# Columnas y estados de la conciliación. Sin dependencias: la app los importa al arrancar
+# sin cargar pandas ni el resto del motor.
+
+# Columnas de los registros extraídos de guías y formularios
+COLUMNAS_GUIA = ['Tracking', 'Fecha_Guia', 'Pais_Destino_Guia', 'Peso_Neto_Guia', 'FMM_Guia',
+                 'Remitente_Usuario_Guia', 'Facturas_Guia']
+COLUMNAS_FMM = ['Tracking', 'Fecha_FMM', 'Pais_Destino_FMM', 'FMM_Formulario', 'Remitente_Usuario_FMM', 'Facturas_FMM']
+
+ESTADO_OK = '✅ OK'
+ESTADO_SOLO_GUIA = '❌ SOLO EN GUÍA'
+ESTADO_SOLO_FMM = '❌ SOLO EN FMM'
+PREFIJO_DIFERENCIAS = '⚠️ Diferencias:'
+
+# Campos comparados (columna de la guía, columna del formulario, etiqueta, columna booleana)
+CAMPOS_COMPARADOS = [
+    ('Fecha_Guia', 'Fecha_FMM', 'Fecha', 'Dif_Fecha'),
+    ('Pais_Normalizado_Guia', 'Pais_Normalizado_FMM', 'País', 'Dif_Pais'),
+    ('FMM_Guia', 'FMM_Formulario', 'FMM', 'Dif_FMM'),
+    ('Facturas_Guia', 'Facturas_FMM', 'Facturas', 'Dif_Facturas'),
+]
+COLUMNAS_DIFERENCIA = [col for _, _, _, col in CAMPOS_COMPARADOS]
@@ -0,0 +1,74 @@
+import io
+from esquema import COLUMNAS_DIFERENCIA, ESTADO_OK, ESTADO_SOLO_FMM, ESTADO_SOLO_GUIA
+
+# Exportación de resultados a Excel (xlsxwriter en modo de memoria constante), CSV y Parquet.
+# Excel se escribe fila a fila por bloques para no materializar el libro completo en memoria.
+# xlsxwriter se importa al exportar a Excel por primera vez, no al arrancar la app.
+FORMATOS_EXPORTACION = {
+    "Excel": (".xlsx", "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"),
+    "CSV": (".csv", "text/csv"),
+    "Parquet": (".parquet", "application/vnd.apache.parquet"),
+}
+FORMATO_POR_EXTENSION = {extension: formato for formato, (extension, _) in FORMATOS_EXPORTACION.items()}
+FILAS_POR_BLOQUE = 10_000
+
+def hojas_por_estado(df):
+    # Hoja completa y una hoja por grupo de estados (solo las que tienen filas), de una en una
+    yield "Conciliación", df
+    if 'Estado_Conciliacion' not in df.columns: return
+    estados = df['Estado_Conciliacion']
+    # Diferencias por las columnas Dif_* (solo son True en trackings presentes en ambos lados); si la
+    # tabla no las trae, por código de estado: todo lo que no es OK ni huérfano
+    if all(col in df.columns for col in COLUMNAS_DIFERENCIA):
+        diferencias = df[COLUMNAS_DIFERENCIA].any(axis=1)
+    else:
+        diferencias = estados.notna() & ~estados.isin([ESTADO_OK, ESTADO_SOLO_GUIA, ESTADO_SOLO_FMM])
+    for nombre, filas in (
+        ("OK", estados == ESTADO_OK),
+        ("Diferencias", diferencias),
+        ("Solo guía", estados == ESTADO_SOLO_GUIA),
+        ("Solo FMM", estados == ESTADO_SOLO_FMM),
+    ):
+        if filas.any(): yield nombre, df[filas]
+
+def escribir_excel(df, destino, por_estado=False):
+    import xlsxwriter
+    libro = xlsxwriter.Workbook(destino, {
+        "constant_memory": True,
+        # Trackings, facturas y textos de los PDF se guardan tal cual, nunca como fórmulas o enlaces
+        "strings_to_formulas": False,
+        "strings_to_urls": False,
+        "default_date_format": "yyyy-mm-dd",
+    })
+    encabezado = libro.add_format({"bold": True})
+    for nombre, datos in hojas_por_estado(df) if por_estado else [("Conciliación", df)]:
+        hoja = libro.add_worksheet(nombre)
+        hoja.write_row(0, 0, ["#", *map(str, datos.columns)], encabezado)
+        fila = 1
+        for inicio in range(0, len(datos), FILAS_POR_BLOQUE):
+            bloque = datos.iloc[inicio:inicio + FILAS_POR_BLOQUE]
+            # Los valores faltantes quedan como celdas vacías
+            bloque = bloque.astype(object).where(bloque.notna(), None)
+            for valores in bloque.itertuples(name=None):
+                hoja.write_row(fila, 0, valores)
+                fila += 1
+    libro.close()
+
+def escribir_csv(df, destino):
+    # Los pesos conservan los dos decimales con que se extraen
+    df.to_csv(destino, index=True, index_label="#", encoding="utf-8-sig", chunksize=FILAS_POR_BLOQUE, float_format="%.2f")
+
+def escribir_parquet(df, destino):
+    df.to_parquet(destino, index=True)
+
+def escribir(df, formato, destino, por_estado=False):
+    # `destino` es una ruta o un buffer binario; las hojas por estado solo aplican a Excel
+    if formato == "Excel": escribir_excel(df, destino, por_estado)
+    elif formato == "CSV": escribir_csv(df, destino)
+    elif formato == "Parquet": escribir_parquet(df, destino)
+    else: raise ValueError(f"Formato de exportación no soportado: {formato}")
+
+def exportar(df, formato, por_estado=False):
+    buffer = io.BytesIO()
+    escribir(df, formato, buffer, por_estado)
+    return buffer.getvalue()
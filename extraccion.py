@@ -0,0 +1,720 @@
+import os
+import re
+import io
+import time
+import logging
+import contextlib
+import pdfplumber
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from pdfminer.pdfdevice import PDFDevice
+from pdfminer.pdffont import PDFUnicodeNotDefined
+from pdfminer.pdfinterp import PDFPageInterpreter
+from datetime import datetime
+from functools import lru_cache
+from archivos import WORKERS_POR_DEFECTO, id_archivo, nombre_archivo
+from cache_extraccion import hash_contenido
+from lotes import LoteArchivos
+from esquema import COLUMNAS_GUIA
+
+logger = logging.getLogger(__name__)
+
+# Versiones usadas en la clave de la caché: cambiar VERSION_TEXTO si cambia la lectura
+# con pdfplumber y VERSION_PARSER si cambian los registros que producen los analizadores
+VERSION_TEXTO = "pdfplumber-x1"
+VERSION_PARSER = "1"
+
+# --- PATRONES PRECOMPILADOS ---
+# Todos los patrones se compilan una sola vez al importar el módulo
+RE_INICIO_BLOQUE = re.compile(r"ORIGIN ID:|EXPRESS WORLDWIDE|UPS WORLDWIDE SERVICE")
+RE_FEDEX_TRACKING = re.compile(r"\b(?:\d{4}\s\d{4}\s\d{4}|\d{12})\b")
+RE_FEDEX_MASTER = re.compile(r"Mstr#\s*(\d{4}\s\d{4}\s\d{4}|\d{12})")
+RE_FEDEX_FECHA = re.compile(r"SHIP DATE:\s*(\d{2}[A-Z]{3}\d{2})", re.IGNORECASE)
+RE_DHL_TRACKING = re.compile(r"WAYBILL\s+([\d\s]{10,})")
+RE_DHL_FECHA = re.compile(r"(\d{4}-\d{2}-\d{2})\s*MyDHL")
+RE_DHL_REFERENCIA = re.compile(r"#(\d{6,})")
+RE_UPS_TRACKING = re.compile(r"SERVICE\s+(COJE[A-Z0-9]+)")
+RE_UPS_FECHA = re.compile(r"Date\s+(\d{1,2}\s+[A-Z]{3}\s+\d{4})", re.IGNORECASE)
+RE_UPS_SERVICIO = re.compile(r"UPS WORLDWIDE SERVICE", re.IGNORECASE)
+RE_ESPACIOS = re.compile(r"\s+")
+RE_PAIS_CODIGO = re.compile(r"\(([A-Z]{2})\)")
+RE_FACTURAS_INV = re.compile(r"INV[:\s]*([A-Z0-9]+)")
+RE_FACTURAS_ZFF = re.compile(r"\b(ZFFE\d+|ZFFV\d+)\b")
+RE_REMITENTE = re.compile(r"(SOLIDEO\s*S\.?A?\.?S\.?)", re.IGNORECASE)
+RE_PESO_NETO = re.compile(r"PN[:\s]*([\d.,]+)", re.IGNORECASE)
+RE_FMM_GUIA = [
+    re.compile(r"FMM[:\s]*(\d+)", re.IGNORECASE),
+    re.compile(r"FMM\s*No\.?\s*(\d+)", re.IGNORECASE),
+    re.compile(r"F\.M\.M\.\s*(\d+)", re.IGNORECASE),
+]
+RE_FMM_LITERAL = re.compile(r"FMM", re.IGNORECASE)
+RE_SEIS_DIGITOS = re.compile(r"\b(\d{6})\b")
+RE_FMM_NUMERO = re.compile(r"FORMULARIO No\. No\.\s*(\d+)")
+RE_FMM_USUARIO = re.compile(r"1\.\s*USUARIO:\s*(SOLIDEO\s*S\.?A?\.?S\.?)", re.IGNORECASE)
+RE_FMM_PAIS = re.compile(r"22\.\s*País Destino:\s*(\d+\s+[A-Z\s]+)")
+RE_CODIGO_INICIAL = re.compile(r"^\d+\s*")
+RE_FMM_FECHA = re.compile(r"(\d{4}/\d{2}/\d{2})")
+RE_FMM_GUIAS_POSTALES = re.compile(r"127\s+GUI?AS DE TRAFICO POSTAL")
+RE_FMM_TRACKINGS = [
+    re.compile(r"\b(8837\d{8})\b"),
+    re.compile(r"\b(\d{4}\s\d{4}\s\d{4})\b"),
+    re.compile(r"\b(\d{12})\b"),
+    re.compile(r"\b(COJE[A-Z0-9]{8,})\b"),
+    re.compile(r"\b(\d{9,10})\b"),
+]
+
+# --- FUNCIONES PRINCIPALES COMPLETAS ---
+def pdf_detectar_operador(texto_guia):
+    texto_upper = texto_guia.upper()
+    if "FEDEX" in texto_upper or "TRK" in texto_upper or "MPS#" in texto_upper: return "FedEx"
+    if "EXPRESS WORLDWIDE" in texto_upper or "WAYBILL" in texto_upper: return "DHL"
+    if "UPS WORLDWIDE SERVICE" in texto_upper or "COJE" in texto_upper: return "UPS"
+    return "Desconocido"
+
+def pdf_extraer_tracking(texto_guia, operador):
+    extractor = EXTRACTORES.get(operador)
+    return extractor.tracking(texto_guia) if extractor else ""
+
+def pdf_extraer_pais_destino(texto_guia):
+    if "UNITED STATES OF AMERICA" in texto_guia: return "UNITED STATES OF AMERICA"
+    m_codigo = RE_PAIS_CODIGO.search(texto_guia)
+    if m_codigo: return m_codigo.group(1)
+    return ""
+
+def pdf_extraer_facturas(texto_guia, operador, ref_no_maestro_dhl):
+    todas = set(RE_FACTURAS_INV.findall(texto_guia))
+    todas.update(RE_FACTURAS_ZFF.findall(texto_guia))
+    if operador == "DHL" and ref_no_maestro_dhl:
+        todas.add(ref_no_maestro_dhl)
+    return ", ".join(sorted(todas)) if todas else ""
+
+def pdf_extraer_remitente(texto_guia):
+    if RE_REMITENTE.search(texto_guia): return "SOLIDEO S.A.S."
+    return ""
+
+def pdf_extraer_peso_neto(texto_guia, operador):
+    match_pn = RE_PESO_NETO.search(texto_guia)
+    if match_pn:
+        peso = match_pn.group(1).replace(",", ".")
+        try: return f"{float(peso):.2f}"
+        except: return peso
+    return ""
+
+def _numero_seis_digitos_antes_de_fmm(texto_guia):
+    # Equivale a r"\b(\d{6})\b(?=.*FMM)" sin el lookahead cuadrático: el primer número
+    # de 6 dígitos de una línea es válido si termina antes del último "FMM" de esa línea
+    for linea in texto_guia.split("\n") if "\n" in texto_guia else (texto_guia,):
+        ultimo_fmm = None
+        for ultimo_fmm in RE_FMM_LITERAL.finditer(linea): pass
+        if ultimo_fmm is None: continue
+        match = RE_SEIS_DIGITOS.search(linea)
+        if match and match.end() <= ultimo_fmm.start(): return match.group(1)
+    return ""
+
+def pdf_extraer_fmm_guia(texto_guia, operador):
+    for patron in RE_FMM_GUIA:
+        match = patron.search(texto_guia)
+        if match: return match.group(1)
+    return _numero_seis_digitos_antes_de_fmm(texto_guia)
+
+def _fecha_ups(match):
+    return datetime.strptime(match.group(1).title(), '%d %b %Y').strftime('%Y-%m-%d')
+
+def pdf_extraer_fecha_ups(texto_guia):
+    match = RE_UPS_FECHA.search(texto_guia)
+    # Sin ningún "Date ..." tampoco puede coincidir el patrón anclado a UPS WORLDWIDE SERVICE
+    if not match: return ""
+    try: return _fecha_ups(match)
+    except ValueError: pass
+    # Primer "Date ..." posterior al primer UPS WORLDWIDE SERVICE (antes r"UPS WORLDWIDE SERVICE.*?Date...")
+    servicio = RE_UPS_SERVICIO.search(texto_guia)
+    match = RE_UPS_FECHA.search(texto_guia, servicio.end()) if servicio else None
+    if match:
+        try: return _fecha_ups(match)
+        except ValueError: pass
+    return ""
+
+def pdf_extraer_fecha_dhl(texto_guia):
+    match = RE_DHL_FECHA.search(texto_guia)
+    return match.group(1) if match else ""
+
+def pdf_extraer_fecha_fedex(texto_guia):
+    match = RE_FEDEX_FECHA.search(texto_guia)
+    if not match: return ""
+    try: return datetime.strptime(match.group(1).title(), '%d%b%y').strftime('%Y-%m-%d')
+    except ValueError: return ""
+
+def pdf_extraer_fecha_guia(texto_guia, operador):
+    extractor = EXTRACTORES.get(operador)
+    return extractor.fecha(texto_guia) if extractor else ""
+
+# --- MOTOR DE EXTRACCIÓN POR OPERADOR ---
+class ExtractorGuia:
+    operador = "Desconocido"
+
+    def tracking(self, bloque):
+        return ""
+
+    def fecha(self, bloque):
+        return ""
+
+    def referencia(self, bloque):
+        return ""
+
+    def registro(self, bloque, ref_no_maestro_dhl=""):
+        # Todos los campos de un bloque con un número fijo de pasadas lineales
+        tracking = self.tracking(bloque)
+        if not tracking: return None
+        return {
+            "Tracking": tracking,
+            "Fecha_Guia": self.fecha(bloque),
+            "Pais_Destino_Guia": pdf_extraer_pais_destino(bloque),
+            "Peso_Neto_Guia": pdf_extraer_peso_neto(bloque, self.operador),
+            "FMM_Guia": pdf_extraer_fmm_guia(bloque, self.operador),
+            "Remitente_Usuario_Guia": pdf_extraer_remitente(bloque),
+            "Facturas_Guia": pdf_extraer_facturas(bloque, self.operador, ref_no_maestro_dhl)
+        }
+
+class ExtractorFedEx(ExtractorGuia):
+    operador = "FedEx"
+
+    def tracking(self, bloque):
+        posibles = [t.replace(" ", "") for t in RE_FEDEX_TRACKING.findall(bloque)]
+        if len(posibles) == 1: return posibles[0]
+        if len(posibles) > 1:
+            match_master = RE_FEDEX_MASTER.search(bloque)
+            master = match_master.group(1).replace(" ", "") if match_master else None
+            for track in posibles:
+                if track != master: return track
+            return posibles[0]
+        return ""
+
+    def fecha(self, bloque):
+        return pdf_extraer_fecha_fedex(bloque)
+
+class ExtractorDHL(ExtractorGuia):
+    operador = "DHL"
+
+    def tracking(self, bloque):
+        m = RE_DHL_TRACKING.search(bloque)
+        return RE_ESPACIOS.sub("", m.group(1)) if m else ""
+
+    def fecha(self, bloque):
+        return pdf_extraer_fecha_dhl(bloque)
+
+    def referencia(self, bloque):
+        match_ref = RE_DHL_REFERENCIA.search(bloque)
+        return match_ref.group(1) if match_ref else ""
+
+class ExtractorUPS(ExtractorGuia):
+    operador = "UPS"
+
+    def tracking(self, bloque):
+        m = RE_UPS_TRACKING.search(bloque)
+        return m.group(1) if m else ""
+
+    def fecha(self, bloque):
+        return pdf_extraer_fecha_ups(bloque)
+
+EXTRACTORES = {e.operador: e for e in (ExtractorFedEx(), ExtractorDHL(), ExtractorUPS())}
+
+def dividir_bloques_guias(texto_normalizado):
+    inicio = None
+    for match in RE_INICIO_BLOQUE.finditer(texto_normalizado):
+        if inicio is not None: yield texto_normalizado[inicio:match.start()]
+        inicio = match.start()
+    yield texto_normalizado[inicio or 0:]
+
+def leer_texto_guias(archivo, metricas=None):
+    with pdfplumber.open(archivo) as pdf:
+        texto_completo = "\n".join(page.extract_text(x_tolerance=1) or "" for page in pdf.pages)
+        if metricas is not None: metricas["paginas"] = len(pdf.pages)
+    return RE_ESPACIOS.sub(' ', texto_completo)
+
+def _registro_bloque(bloque, ultimo_ref_dhl):
+    # Devuelve el registro del bloque (o None) y la referencia DHL vigente tras el bloque
+    extractor = EXTRACTORES.get(pdf_detectar_operador(bloque))
+    if extractor is None: return None, ultimo_ref_dhl
+    ultimo_ref_dhl = extractor.referencia(bloque) or ultimo_ref_dhl
+    return extractor.registro(bloque, ultimo_ref_dhl), ultimo_ref_dhl
+
+def analizar_texto_guias(texto_normalizado, metricas=None):
+    datos_pdf = []
+    bloques = 1
+    operador = pdf_detectar_operador(texto_normalizado)
+    
+    if operador == "UPS":
+        registro = EXTRACTORES["UPS"].registro(texto_normalizado)
+        if registro: datos_pdf.append(registro)
+    else:
+        ultimo_ref_dhl = ""
+        for bloques, bloque in enumerate(dividir_bloques_guias(texto_normalizado), start=1):
+            registro, ultimo_ref_dhl = _registro_bloque(bloque, ultimo_ref_dhl)
+            if registro: datos_pdf.append(registro)
+    if metricas is not None: metricas["bloques"] = bloques
+    return datos_pdf
+
+def leer_y_analizar_guias(archivo, metricas=None):
+    texto = leer_texto_guias(archivo, metricas)
+    return texto, analizar_texto_guias(texto, metricas)
+
+# --- LECTURA POR PÁGINAS (STREAMING) PARA PDF DE GUÍAS MUY GRANDES ---
+PALABRAS_FEDEX_DHL = ("FEDEX", "TRK", "MPS#", "EXPRESS WORLDWIDE", "WAYBILL")
+PALABRAS_UPS = ("UPS WORLDWIDE SERVICE", "COJE")
+_LARGO_MAX_PALABRA = max(len(p) for p in PALABRAS_FEDEX_DHL + PALABRAS_UPS)
+_LARGO_MAX_INICIO = len("UPS WORLDWIDE SERVICE")
+
+def iterar_textos_paginas(archivo, metricas=None):
+    with pdfplumber.open(archivo) as pdf:
+        for page in pdf.pages:
+            if metricas is not None: metricas["paginas"] = metricas.get("paginas", 0) + 1
+            texto = page.extract_text(x_tolerance=1) or ""
+            # Liberar los objetos de la página ya leída
+            page.close()
+            yield texto
+
+class _DivisorBloques:
+    # Corta bloques de guía a medida que llega texto normalizado; solo conserva el bloque en curso
+    def __init__(self):
+        self.texto = ""
+        self.inicio = None
+        self.buscar_desde = 0
+
+    def agregar(self, pieza):
+        self.texto += pieza
+        bloques = []
+        fin_ultimo = self.buscar_desde
+        for match in RE_INICIO_BLOQUE.finditer(self.texto, self.buscar_desde):
+            if self.inicio is not None: bloques.append(self.texto[self.inicio:match.start()])
+            self.inicio, fin_ultimo = match.start(), match.end()
+        if self.inicio:
+            # Descartar los bloques ya entregados (o el texto previo al primer inicio)
+            self.texto = self.texto[self.inicio:]
+            fin_ultimo -= self.inicio
+            self.inicio = 0
+        # Un inicio de bloque puede quedar partido entre esta página y la siguiente
+        self.buscar_desde = max(fin_ultimo, len(self.texto) - _LARGO_MAX_INICIO + 1, 0)
+        return bloques
+
+    def finalizar(self):
+        return self.texto[self.inicio or 0:]
+
+def analizar_paginas_guias(textos_paginas, metricas=None):
+    # Generador equivalente a analizar_texto_guias("\n".join(páginas) normalizado). El texto se
+    # retiene solo mientras el documento aún podría ser una guía UPS completa (ninguna palabra
+    # de FedEx/DHL vista); después solo se conserva el bloque en curso.
+    divisor = _DivisorBloques()
+    bloques_vistos = 0
+    pendiente = []
+    hay_fedex_dhl = hay_ups = False
+    cola, termina_en_espacio, ultimo_ref_dhl = "", False, ""
+    
+    for n, pagina in enumerate(textos_paginas):
+        pieza = RE_ESPACIOS.sub(' ', pagina if n == 0 else "\n" + pagina)
+        if termina_en_espacio and pieza.startswith(" "): pieza = pieza[1:]
+        if not pieza: continue
+        termina_en_espacio = pieza.endswith(" ")
+        
+        ventana = (cola + pieza).upper()
+        hay_fedex_dhl = hay_fedex_dhl or any(p in ventana for p in PALABRAS_FEDEX_DHL)
+        hay_ups = hay_ups or any(p in ventana for p in PALABRAS_UPS)
+        cola = (cola + pieza)[-(_LARGO_MAX_PALABRA - 1):]
+        
+        pendiente.append(pieza)
+        if not hay_fedex_dhl: continue
+        for bloque in divisor.agregar("".join(pendiente)):
+            bloques_vistos += 1
+            registro, ultimo_ref_dhl = _registro_bloque(bloque, ultimo_ref_dhl)
+            if registro: yield registro
+        pendiente = []
+    
+    if hay_ups and not hay_fedex_dhl:
+        # Documento UPS: la regla se aplica sobre el texto completo
+        yield from analizar_texto_guias("".join(pendiente), metricas)
+        return
+    bloques = divisor.agregar("".join(pendiente)) if pendiente else []
+    for bloque in bloques + [divisor.finalizar()]:
+        bloques_vistos += 1
+        registro, ultimo_ref_dhl = _registro_bloque(bloque, ultimo_ref_dhl)
+        if registro: yield registro
+    if metricas is not None: metricas["bloques"] = bloques_vistos
+
+def iterar_registros_guias(archivo, metricas=None):
+    yield from analizar_paginas_guias(iterar_textos_paginas(archivo, metricas), metricas)
+
+def leer_guias_por_paginas(archivo, metricas=None):
+    # Sin texto completo que guardar en caché: solo los registros
+    return None, list(iterar_registros_guias(archivo, metricas))
+
+# --- EXTRACCIÓN POR LOTES (SERIAL O MULTIPROCESO, CON CACHÉ) ---
+def _origen_serializable(archivo):
+    # Las rutas viajan tal cual (los PDF de un lote como su ruta temporal); los buffers se envían como bytes
+    if isinstance(archivo, (str, os.PathLike)): return os.fspath(archivo)
+    if hasattr(archivo, "getvalue"): return archivo.getvalue()
+    archivo.seek(0)
+    return archivo.read()
+
+def tamano_archivo(archivo):
+    if isinstance(archivo, (bytes, bytearray)): return len(archivo)
+    if isinstance(archivo, (str, os.PathLike)): return os.path.getsize(archivo)
+    tamano = getattr(archivo, "size", None)
+    if tamano is not None: return tamano
+    if hasattr(archivo, "getbuffer"): return archivo.getbuffer().nbytes
+    return None
+
+def _ejecutar_tarea(tarea):
+    procesador, mensaje_error, nombre, origen = tarea
+    metricas = {"archivo": nombre, "cache": False}
+    inicio = time.perf_counter()
+    try:
+        metricas["bytes"] = tamano_archivo(origen)
+        if isinstance(origen, bytes): origen = io.BytesIO(origen)
+        elif isinstance(origen, os.PathLike): origen = os.fspath(origen)
+        texto, registros = procesador(origen, metricas)
+        error = None
+    except Exception as e:
+        texto, registros, error = None, [], f"{mensaje_error} {nombre}: {e}"
+    metricas["segundos"] = round(time.perf_counter() - inicio, 6)
+    metricas["registros"] = len(registros)
+    metricas["error"] = error
+    return texto, registros, error, metricas
+
+def extraer_por_archivo(procesador, analizador, archivos, mensaje_error, reportar_error=None, max_workers=1, cache=None,
+                        tipo="", rendimiento=None, progreso=None, cancelado=None, pool=None, expandido=None,
+                        partes=False):
+    # Los ZIP se expanden a sus PDF y los PDF con contenido repetido se omiten antes de leerlos
+    # (lotes.LoteArchivos); expandido(n) recibe el número de PDF distintos que se van a extraer.
+    # Devuelve los registros de cada entrada (los de todos sus PDF si es un ZIP), en el mismo orden.
+    # Con partes=True cada entrada es (registros, partes): los registros incluyen también los de sus
+    # PDF repetidos de otra entrada y partes = [(huella, n)] dice de qué contenido es cada tramo,
+    # para que la conciliación cuente cada contenido una sola vez (conciliacion_incremental).
+    reportar_error = reportar_error or logger.error
+    archivos = list(archivos)
+    with LoteArchivos() as lote:
+        entradas = list(lote.expandir(archivos, reportar_error, mensaje_error))
+        for nombre, original in lote.duplicados:
+            logger.info(f"{nombre}: mismo contenido que {original}, se omite")
+            if rendimiento is not None:
+                rendimiento.registrar_archivo({"tipo": tipo, "archivo": nombre, "duplicado_de": original, "cache": False,
+                                               "registros": 0, "error": None, "segundos": 0.0})
+        if expandido: expandido(len(entradas))
+        por_pdf = _extraer_pdfs(procesador, analizador, [pdf for _, pdf in entradas], mensaje_error, reportar_error,
+                                max_workers, cache, tipo, rendimiento, progreso, cancelado, pool)
+    # Una entrada con algún PDF sin terminar (cancelado) queda como None para extraerla de nuevo
+    por_entrada = [[] for _ in archivos]
+    tramos = [[] for _ in archivos]
+    for i, posicion, repetido in lote.orden:
+        if por_entrada[i] is None: continue
+        if repetido and (not partes or entradas[posicion][0] == i): continue
+        registros = por_pdf[posicion]
+        if registros is None:
+            por_entrada[i] = None
+            continue
+        por_entrada[i].extend(registros)
+        tramos[i].append((lote.huellas[posicion], len(registros)))
+    if not partes: return por_entrada
+    return [None if registros is None else (registros, t) for registros, t in zip(por_entrada, tramos)]
+
+def _extraer_pdfs(procesador, analizador, archivos, mensaje_error, reportar_error, max_workers, cache, tipo, rendimiento,
+                  progreso, cancelado, pool):
+    # procesador(archivo, metricas) -> (texto, registros); analizador(texto) -> registros se usa para
+    # volver a analizar el texto guardado en caché cuando cambia VERSION_PARSER.
+    # Con `rendimiento` (RegistroRendimiento) se registran las métricas de cada archivo.
+    # Devuelve una lista de registros por archivo, en el mismo orden de entrada,
+    # aislando los errores de cada archivo. Con caché, solo se leen los PDF no vistos.
+    # progreso(metricas) se llama al terminar cada archivo (en orden de finalización); si
+    # cancelado() devuelve True no se empiezan más archivos y los pendientes quedan como None.
+    # Con `pool` (ProcessPoolExecutor ya arrancado) los archivos se leen en él y no se crea uno nuevo.
+    resultados = [None] * len(archivos)
+    claves = [None] * len(archivos)
+    pendientes = []
+    
+    for i, archivo in enumerate(archivos):
+        if cache is not None:
+            inicio = time.perf_counter()
+            metricas = {"archivo": nombre_archivo(archivo), "cache": True}
+            try:
+                metricas["bytes"] = tamano_archivo(archivo)
+                claves[i] = hash_contenido(archivo, f"{tipo}|{VERSION_TEXTO}|")
+            except Exception as e:
+                error = f"{mensaje_error} {nombre_archivo(archivo)}: {e}"
+                resultados[i] = ([], error, {**metricas, "cache": False, "registros": 0, "error": error,
+                                             "segundos": round(time.perf_counter() - inicio, 6)})
+                if progreso: progreso(resultados[i][2])
+                continue
+            entrada = cache.obtener(claves[i])
+            registros = None
+            if entrada is not None and entrada.get("version_parser") == VERSION_PARSER:
+                registros = entrada["registros"]
+            elif entrada is not None and entrada.get("texto") is not None:
+                # El texto sigue siendo válido: solo se vuelve a analizar
+                registros = analizador(entrada["texto"])
+                cache.guardar(claves[i], {"texto": entrada["texto"], "version_parser": VERSION_PARSER, "registros": registros})
+            if registros is not None:
+                metricas.update(registros=len(registros), error=None, segundos=round(time.perf_counter() - inicio, 6))
+                resultados[i] = (registros, None, metricas)
+                if progreso: progreso(metricas)
+                continue
+        pendientes.append(i)
+    
+    def terminar(i, salida):
+        texto, registros, error, metricas = salida
+        if cache is not None and error is None:
+            cache.guardar(claves[i], {"texto": texto, "version_parser": VERSION_PARSER, "registros": registros})
+        resultados[i] = (registros, error, metricas)
+        if progreso: progreso(metricas)
+    
+    if pool is not None and pendientes or max_workers > 1 and len(pendientes) > 1:
+        tareas = [(procesador, mensaje_error, nombre_archivo(archivos[i]), _origen_serializable(archivos[i])) for i in pendientes]
+        propio, caidos = pool is None, []
+        
+        def salida(futuro, i):
+            # Con un pool ajeno, la caída de un proceso se propaga para que su dueño lo recree
+            try:
+                terminar(i, futuro.result())
+            except BrokenProcessPool:
+                if not propio: raise
+                caidos.append(i)
+        
+        with contextlib.nullcontext(pool) if not propio else ProcessPoolExecutor(
+            max_workers=min(max_workers, len(pendientes))
+        ) as pool:
+            futuros = {pool.submit(_ejecutar_tarea, tarea): i for i, tarea in zip(pendientes, tareas)}
+            for futuro in as_completed(futuros):
+                salida(futuro, futuros[futuro])
+                if cancelado and cancelado():
+                    for pendiente in futuros: pendiente.cancel()
+                    break
+        # Al cancelar, los archivos que ya estaban en curso terminan igualmente y se conservan
+        for futuro, i in futuros.items():
+            if resultados[i] is None and futuro.done() and not futuro.cancelled() and i not in caidos: salida(futuro, i)
+        # Si un proceso murió (p. ej. sin memoria con un PDF patológico) no se sabe qué archivo lo causó:
+        # los afectados se reintentan de uno en uno en un proceso aparte y solo falla el culpable
+        aislado = None
+        for i in sorted(caidos):
+            if cancelado and cancelado(): break
+            aislado = aislado or ProcessPoolExecutor(max_workers=1)
+            try:
+                terminar(i, aislado.submit(_ejecutar_tarea, tareas[pendientes.index(i)]).result())
+            except BrokenProcessPool as e:
+                nombre = nombre_archivo(archivos[i])
+                error = f"{mensaje_error} {nombre}: el proceso de extracción terminó inesperadamente ({e})"
+                terminar(i, (None, [], error, {"archivo": nombre, "cache": False, "segundos": 0.0, "registros": 0,
+                                               "error": error}))
+                aislado.shutdown()
+                aislado = None
+        if aislado is not None: aislado.shutdown()
+    else:
+        for i in pendientes:
+            if cancelado and cancelado(): break
+            terminar(i, _ejecutar_tarea((procesador, mensaje_error, nombre_archivo(archivos[i]), archivos[i])))
+    
+    por_archivo = []
+    for resultado in resultados:
+        if resultado is None:
+            por_archivo.append(None)
+            continue
+        datos, error, metricas = resultado
+        if error: reportar_error(error)
+        if rendimiento is not None: rendimiento.registrar_archivo({"tipo": tipo, **metricas})
+        por_archivo.append(datos)
+    return por_archivo
+
+def extraer_guias_por_archivo(archivos, reportar_error=None, max_workers=1, cache=None, por_paginas=False,
+                              rendimiento=None, progreso=None, cancelado=None, pool=None, expandido=None,
+                              partes=False):
+    procesador = leer_guias_por_paginas if por_paginas else leer_y_analizar_guias
+    return extraer_por_archivo(procesador, analizar_texto_guias, archivos, "Error procesando",
+                               reportar_error, max_workers, cache, "guias", rendimiento, progreso, cancelado, pool,
+                               expandido, partes)
+
+def procesar_archivos_guias_pdf(archivos, reportar_error=None, max_workers=1, cache=None, por_paginas=False,
+                                rendimiento=None, pool=None):
+    # pandas solo en el proceso que arma el DataFrame, no en los procesos de extracción
+    from registros import BufferColumnar
+    buffer = BufferColumnar(COLUMNAS_GUIA)
+    for registros in extraer_guias_por_archivo(archivos, reportar_error, max_workers, cache, por_paginas, rendimiento,
+                                               pool=pool):
+        buffer.extender(registros)
+    
+    # Eliminar duplicados
+    return buffer.a_dataframe().drop_duplicates(subset=['Tracking'], keep='first')
+
+def extraer_formularios_por_archivo(archivos, reportar_error=None, max_workers=1, cache=None, dirigido=False,
+                                    rendimiento=None, progreso=None, cancelado=None, pool=None, expandido=None,
+                                    partes=False):
+    procesador = leer_y_analizar_formulario_dirigido if dirigido else leer_y_analizar_formulario
+    # Las líneas guardadas en modo dirigido son solo las de las páginas relevantes
+    tipo = "formulario_dirigido" if dirigido else "formulario"
+    return extraer_por_archivo(procesador, analizar_lineas_formulario, archivos, "Error leyendo formulario",
+                               reportar_error, max_workers, cache, tipo, rendimiento, progreso, cancelado, pool,
+                               expandido, partes)
+
+def procesar_formularios_pdf(archivos, reportar_error=None, max_workers=1, cache=None, dirigido=False, rendimiento=None,
+                             pool=None):
+    return [registro for registros in extraer_formularios_por_archivo(archivos, reportar_error, max_workers, cache,
+                                                                      dirigido, rendimiento, pool=pool)
+            for registro in registros]
+
+def leer_lineas_formulario(archivo, metricas=None):
+    with pdfplumber.open(archivo) as pdf:
+        contenido_completo = "\n".join(page.extract_text(x_tolerance=1) or "" for page in pdf.pages)
+        if metricas is not None: metricas["paginas"] = metricas["paginas_extraidas"] = len(pdf.pages)
+    return contenido_completo.splitlines()
+
+def leer_y_analizar_formulario(archivo, metricas=None):
+    lineas = leer_lineas_formulario(archivo, metricas)
+    if metricas is not None: metricas["lineas"] = len(lineas)
+    return lineas, analizar_lineas_formulario(lineas)
+
+# --- EXTRACCIÓN DIRIGIDA DE FORMULARIOS (SOLO PÁGINAS RELEVANTES) ---
+# Textos que activan alguna regla de analizar_lineas_formulario, sin espacios
+ANCLAS_ENCABEZADO_FMM = ("FORMULARIONo.No.", "1.USUARIO:", "22.PaísDestino:")
+ANCLA_ANEXOS_FMM = "DETALLEDELOSANEXOS"
+ANCLAS_FILAS_ANEXOS_FMM = ("FACTURACOMERCIAL", "TRAFICOPOSTAL")
+# Misma expansión de ligaduras que hace pdfplumber en extract_text
+_LIGADURAS = str.maketrans({"ﬀ": "ff", "ﬃ": "ffi", "ﬄ": "ffl", "ﬁ": "fi", "ﬂ": "fl", "ﬆ": "st", "ﬅ": "st"})
+
+class _SondaTexto(PDFDevice):
+    # Dispositivo de pdfminer que solo decodifica el texto dibujado, sin geometría ni layout:
+    # mucho más barato que page.chars y con los mismos caracteres (misma fuente y ToUnicode)
+    def __init__(self, rsrcmgr):
+        super().__init__(rsrcmgr)
+        self.partes = []
+
+    def render_string(self, textstate, seq, ncs, graphicstate):
+        font = textstate.font
+        for obj in seq:
+            if not isinstance(obj, bytes): continue
+            for cid in font.decode(obj):
+                try: self.partes.append(font.to_unichr(cid))
+                except PDFUnicodeNotDefined: pass
+
+def sondear_paginas(pdf):
+    # Texto de cada página sin espacios (None si no se pudo sondear la página)
+    sondas = []
+    for page in pdf.pages:
+        try:
+            dispositivo = _SondaTexto(pdf.rsrcmgr)
+            PDFPageInterpreter(pdf.rsrcmgr, dispositivo).process_page(page.page_obj)
+            sondas.append("".join("".join(dispositivo.partes).translate(_LIGADURAS).split()))
+        except Exception:
+            sondas.append(None)
+    return sondas
+
+def seleccionar_paginas_formulario(sondas):
+    # Páginas cuyas líneas pueden afectar al resultado; None si no se encuentran las anclas.
+    # Las páginas que no se pudieron sondear siempre se extraen.
+    inicio_anexos = next((i for i, t in enumerate(sondas) if t is None or ANCLA_ANEXOS_FMM in t), None)
+    if inicio_anexos is None or all(t is not None and not any(a in t for a in ANCLAS_ENCABEZADO_FMM) for t in sondas):
+        return None
+    paginas = []
+    for i, texto in enumerate(sondas):
+        relevante = texto is None or any(a in texto for a in ANCLAS_ENCABEZADO_FMM)
+        if i >= inicio_anexos:
+            relevante = relevante or ANCLA_ANEXOS_FMM in texto or any(a in texto for a in ANCLAS_FILAS_ANEXOS_FMM)
+        if relevante: paginas.append(i)
+    return paginas
+
+def leer_lineas_formulario_dirigido(archivo, metricas=None):
+    with pdfplumber.open(archivo) as pdf:
+        paginas = seleccionar_paginas_formulario(sondear_paginas(pdf))
+        if paginas is None:
+            # Sin anclas: extracción completa
+            paginas = range(len(pdf.pages))
+        contenido = "\n".join(pdf.pages[i].extract_text(x_tolerance=1) or "" for i in paginas)
+        if metricas is not None:
+            metricas["paginas"], metricas["paginas_extraidas"] = len(pdf.pages), len(paginas)
+    return contenido.splitlines()
+
+def leer_y_analizar_formulario_dirigido(archivo, metricas=None):
+    lineas = leer_lineas_formulario_dirigido(archivo, metricas)
+    if metricas is not None: metricas["lineas"] = len(lineas)
+    return lineas, analizar_lineas_formulario(lineas)
+
+def procesar_formulario_pdf(archivo, reportar_error=None):
+    reportar_error = reportar_error or logger.error
+    try:
+        lineas = leer_lineas_formulario(archivo)
+    except Exception as e:
+        reportar_error(f"Error leyendo formulario {nombre_archivo(archivo)}: {e}")
+        return []
+    return analizar_lineas_formulario(lineas)
+
+def _factura_tiene_comentarios(linea, factura):
+    # Texto después de la primera fecha que sigue a la factura (antes factura + r'.*?(\d{4}/\d{2}/\d{2})\s*(.*)')
+    inicio = linea.find(factura)
+    match = RE_FMM_FECHA.search(linea, inicio + len(factura)) if inicio >= 0 else None
+    return bool(match and linea[match.end():].strip())
+
+def seleccionar_factura_formulario(facturas_con_info):
+    # facturas_con_info: (factura, tiene_comentarios) en orden de aparición en los anexos.
+    # Una sola factura se toma siempre; con varias, la primera ZFFV sin comentarios (o la primera
+    # ZFFV) y, si no hay ZFFV, lo mismo entre las ZFFE
+    if len(facturas_con_info) == 1: return facturas_con_info[0][0]
+    for prefijo in ("ZFFV", "ZFFE"):
+        candidatas = [(f, com) for f, com in facturas_con_info if f.startswith(prefijo)]
+        if candidatas:
+            return next((f for f, com in candidatas if not com), candidatas[0][0])
+    return ""
+
+@lru_cache(maxsize=4096)
+def _fecha_iso_anexo(fecha):
+    # Los anexos repiten pocas fechas distintas; strptime es lo más caro de cada línea
+    try: return datetime.strptime(fecha, '%Y/%m/%d').strftime('%Y-%m-%d')
+    except ValueError: return ""
+
+def _fecha_anexo(linea):
+    match = RE_FMM_FECHA.search(linea)
+    return _fecha_iso_anexo(match.group(1)) if match else ""
+
+def analizar_lineas_formulario(lineas):
+    # Una sola pasada: campos del encabezado (gana la última aparición), y dentro de los anexos
+    # las facturas comerciales y las guías de tráfico postal
+    fmm_formulario, usuario, pais_destino = "", "", ""
+    en_anexos = False
+    facturas_con_info = []
+    guias = {}  # tracking -> fecha; la primera aparición gana
+    
+    for linea in lineas:
+        if "FORMULARIO No. No." in linea:
+            match = RE_FMM_NUMERO.search(linea)
+            if match: fmm_formulario = match.group(1)
+        if "1. USUARIO:" in linea and RE_FMM_USUARIO.search(linea):
+            usuario = "SOLIDEO S.A.S."
+        if "22. País Destino:" in linea:
+            match = RE_FMM_PAIS.search(linea)
+            if match: pais_destino = RE_CODIGO_INICIAL.sub('', match.group(1).strip()).strip()
+        
+        if "DETALLE DE LOS ANEXOS" in linea:
+            en_anexos = True
+            continue
+        if not en_anexos: continue
+        
+        if "FACTURA COMERCIAL" in linea:
+            facturas_con_info.extend(
+                (factura, _factura_tiene_comentarios(linea, factura)) for factura in RE_FACTURAS_ZFF.findall(linea)
+            )
+        if RE_FMM_GUIAS_POSTALES.search(linea):
+            # Cada patrón aporta como mucho un tracking (su primera coincidencia en la línea)
+            fecha = None
+            for patron in RE_FMM_TRACKINGS:
+                match = patron.search(linea)
+                if not match: continue
+                tracking = match.group(1).replace(" ", "")
+                if tracking not in guias:
+                    if fecha is None: fecha = _fecha_anexo(linea)
+                    guias[tracking] = fecha
+    
+    factura_a_asignar = seleccionar_factura_formulario(facturas_con_info)
+    return [
+        {
+            "Tracking": tracking,
+            "Fecha_FMM": fecha,
+            "Pais_Destino_FMM": pais_destino,
+            "FMM_Formulario": fmm_formulario,
+            "Remitente_Usuario_FMM": usuario,
+            "Facturas_FMM": factura_a_asignar
+        }
+        for tracking, fecha in guias.items()
+    ]
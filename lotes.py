@@ -0,0 +1,133 @@
+import os
+import hashlib
+import zipfile
+import tempfile
+from archivos import id_archivo, nombre_archivo
+
+# Lotes de entrada para la extracción: los ZIP se expanden miembro a miembro (descompresión en
+# streaming) a archivos temporales en disco, y los buffers cargados (UploadedFile, BytesIO) se
+# vuelcan igual, así que los procesos de extracción reciben rutas y no copias de los bytes.
+# Los PDF con el mismo contenido (SHA-256, calculado mientras se copian) se omiten antes de
+# analizarlos; lote.orden guarda, para cada PDF visto (repetido o no), su entrada y la posición del
+# PDF con ese contenido entre los que devuelve expandir, y lote.huellas el hash de cada uno. Los
+# nombres de los miembros no se usan como rutas: solo en los mensajes.
+TAMANO_BLOQUE = 1 << 20
+# ZIP dañado o no soportado (cifrado, compresión desconocida) y errores de disco
+_ERRORES_LECTURA = (OSError, EOFError, zipfile.BadZipFile, zipfile.LargeZipFile, RuntimeError, NotImplementedError)
+
+def es_zip(archivo):
+    return nombre_archivo(archivo).lower().endswith(".zip")
+
+def es_pdf(nombre):
+    return nombre.lower().endswith(".pdf")
+
+class ArchivoTemporal:
+    # PDF volcado al directorio del lote, con el nombre original (p. ej. "lote.zip/guia1.pdf")
+    __slots__ = ("ruta", "name", "file_id", "size")
+
+    def __init__(self, ruta, name, file_id, size):
+        self.ruta, self.name, self.file_id, self.size = ruta, name, file_id, size
+
+    def __fspath__(self):
+        return self.ruta
+
+class LoteArchivos:
+    # Uso: with LoteArchivos() as lote: for i, pdf in lote.expandir(archivos, reportar_error): ...
+    # Los temporales se eliminan al salir del bloque
+    def __init__(self, directorio=None):
+        self._directorio_base = directorio
+        self._temporal = None
+        self._hashes = {}
+        self.huellas = []
+        self.orden = []
+        self.duplicados = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        if self._temporal is not None:
+            self._temporal.cleanup()
+            self._temporal = None
+
+    @property
+    def directorio(self):
+        if self._temporal is None:
+            self._temporal = tempfile.TemporaryDirectory(prefix="conciliacion_lote_", dir=self._directorio_base)
+        return self._temporal.name
+
+    def _es_nuevo(self, huella, nombre, entrada):
+        # Cada PDF nuevo es el siguiente que devuelve expandir: su posición es el número de hashes vistos
+        if huella in self._hashes:
+            original, posicion = self._hashes[huella]
+            self.duplicados.append((nombre, original))
+            self.orden.append((entrada, posicion, True))
+            return False
+        self._hashes[huella] = (nombre, len(self.huellas))
+        self.orden.append((entrada, len(self.huellas), False))
+        self.huellas.append(huella)
+        return True
+
+    def _volcar(self, origen, nombre, file_id, entrada):
+        # Copia por bloques al directorio del lote calculando el hash; None si el contenido ya estaba
+        h = hashlib.sha256()
+        fd, ruta = tempfile.mkstemp(dir=self.directorio, suffix=".pdf")
+        tamano = 0
+        try:
+            with os.fdopen(fd, "wb") as destino:
+                for bloque in iter(lambda: origen.read(TAMANO_BLOQUE), b""):
+                    h.update(bloque)
+                    destino.write(bloque)
+                    tamano += len(bloque)
+        except BaseException:
+            os.remove(ruta)
+            raise
+        if not self._es_nuevo(h.hexdigest(), nombre, entrada):
+            os.remove(ruta)
+            return None
+        return ArchivoTemporal(ruta, nombre, file_id, tamano)
+
+    def _ruta_en_sitio(self, ruta, entrada):
+        # Las rutas locales no se copian: solo se calcula su hash leyendo por bloques
+        h = hashlib.sha256()
+        with open(ruta, "rb") as f:
+            for bloque in iter(lambda: f.read(TAMANO_BLOQUE), b""):
+                h.update(bloque)
+        return ruta if self._es_nuevo(h.hexdigest(), nombre_archivo(ruta), entrada) else None
+
+    def _miembros_zip(self, archivo, entrada, reportar_error, mensaje_error):
+        # Un miembro dañado (CRC, cifrado, compresión no soportada) se reporta con su nombre y se sigue
+        nombre_zip, id_zip = nombre_archivo(archivo), id_archivo(archivo)
+        if hasattr(archivo, "seek"): archivo.seek(0)
+        with zipfile.ZipFile(archivo) as zf:
+            for info in zf.infolist():
+                if info.is_dir() or not es_pdf(info.filename) or info.filename.startswith("__MACOSX/"): continue
+                nombre = f"{nombre_zip}/{info.filename}"
+                try:
+                    with zf.open(info) as miembro:
+                        pdf = self._volcar(miembro, nombre, f"{id_zip}/{info.filename}", entrada)
+                except _ERRORES_LECTURA as e:
+                    reportar_error(f"{mensaje_error} {nombre}: {e}".strip())
+                    continue
+                if pdf is not None: yield pdf
+
+    def expandir(self, archivos, reportar_error, mensaje_error=""):
+        # (posición de la entrada, PDF a extraer) para cada PDF distinto del lote, en orden; un ZIP
+        # aporta un PDF por miembro. Un ZIP ilegible se reporta y se sigue con el resto
+        for i, archivo in enumerate(archivos):
+            try:
+                if es_zip(archivo):
+                    for pdf in self._miembros_zip(archivo, i, reportar_error, mensaje_error):
+                        yield i, pdf
+                    if hasattr(archivo, "seek"): archivo.seek(0)
+                    continue
+                if isinstance(archivo, (str, os.PathLike)):
+                    pdf = self._ruta_en_sitio(archivo, i)
+                else:
+                    archivo.seek(0)
+                    pdf = self._volcar(archivo, nombre_archivo(archivo), id_archivo(archivo), i)
+                    archivo.seek(0)
+            except _ERRORES_LECTURA as e:
+                reportar_error(f"{mensaje_error} {nombre_archivo(archivo)}: {e}".strip())
+                continue
+            if pdf is not None: yield i, pdf
@@ -0,0 +1,93 @@
+import sys
+import pandas as pd
+from conciliacion import COLUMNAS_FMM, COLUMNAS_GUIA
+
+# Registros extraídos en columnas tipadas en lugar de listas de dicts con texto: fechas como
+# datetime64, pesos como float, países y remitentes como categorías y trackings internados.
+# Las fechas vacías quedan como NaT (se comparan igual que dos textos vacíos); una columna
+# con valores que no se pueden convertir se deja como texto.
+COLUMNAS_FECHA = ('Fecha_Guia', 'Fecha_FMM')
+COLUMNAS_PESO = ('Peso_Neto_Guia',)
+COLUMNAS_CATEGORIA = (
+    'Pais_Destino_Guia', 'Pais_Destino_FMM', 'Pais_Normalizado_Guia', 'Pais_Normalizado_FMM',
+    'Remitente_Usuario_Guia', 'Remitente_Usuario_FMM',
+)
+FORMATO_FECHA = '%Y-%m-%d'
+
+def _sin_perdida(tipada, valores):
+    # Si algún valor no vacío no se pudo convertir se conserva el texto original, para no
+    # perder el dato ni ocultar una diferencia (p. ej. una fecha inválida frente a otra)
+    vacios = pd.Series(valores, dtype=object).isin(("", None)).to_numpy()
+    return valores if (pd.isna(tipada) & ~vacios).any() else tipada
+
+def _columna_tipada(nombre, valores):
+    if nombre in COLUMNAS_FECHA:
+        return _sin_perdida(pd.to_datetime(valores, format=FORMATO_FECHA, errors='coerce'), valores)
+    if nombre in COLUMNAS_PESO:
+        pesos = pd.to_numeric(pd.Series(valores, dtype=object), errors='coerce').astype('float64').to_numpy()
+        return _sin_perdida(pesos, valores)
+    if nombre in COLUMNAS_CATEGORIA: return pd.Categorical(valores)
+    return valores
+
+class BufferColumnar:
+    # Acumula registros (dicts) columna a columna y construye el DataFrame tipado una sola vez
+    def __init__(self, columnas):
+        self.columnas = list(columnas)
+        self._valores = {col: [] for col in self.columnas}
+
+    def __len__(self):
+        return len(self._valores[self.columnas[0]])
+
+    def agregar(self, registro):
+        for col, valores in self._valores.items():
+            valor = registro.get(col) or ""
+            valores.append(sys.intern(valor) if col == 'Tracking' else valor)
+
+    def extender(self, registros):
+        for registro in registros: self.agregar(registro)
+        return self
+
+    def a_dataframe(self):
+        return pd.DataFrame({col: _columna_tipada(col, valores) for col, valores in self._valores.items()},
+                            columns=self.columnas)
+
+def guias_a_dataframe(registros):
+    return BufferColumnar(COLUMNAS_GUIA).extender(registros).a_dataframe()
+
+def formularios_a_dataframe(registros):
+    return BufferColumnar(COLUMNAS_FMM).extender(registros).a_dataframe()
+
+def tipar(df):
+    # DataFrame tipado a partir de uno con los registros en texto (p. ej. leído de SQLite)
+    return pd.DataFrame({col: _columna_tipada(col, df[col].tolist()) for col in df.columns}, columns=df.columns)
+
+def compactar(df):
+    # Vuelve a categorizar las columnas que un concat o un merge dejaron como texto
+    for col in COLUMNAS_CATEGORIA:
+        if col in df.columns and not isinstance(df[col].dtype, pd.CategoricalDtype):
+            df[col] = df[col].astype('category')
+    return df
+
+def _texto(col, serie):
+    # Columna como el texto de la extracción: fechas AAAA-MM-DD, pesos con 2 decimales, vacíos como ""
+    if col in COLUMNAS_FECHA and pd.api.types.is_datetime64_any_dtype(serie):
+        serie = serie.dt.strftime(FORMATO_FECHA)
+    elif col in COLUMNAS_PESO and pd.api.types.is_float_dtype(serie):
+        serie = serie.map(lambda peso: f"{peso:.2f}", na_action='ignore')
+    return serie.astype(object).where(serie.notna(), "")
+
+def concatenar(partes, columnas):
+    # Concat de DataFrames tipados por separado (p. ej. uno por archivo). Si una fecha o un peso quedó
+    # como texto en alguna parte, la columna se vuelve a tipar desde el texto de todas, igual que si
+    # los registros se hubieran extraído juntos
+    partes = [parte for parte in partes if len(parte)]
+    if not partes: return BufferColumnar(columnas).a_dataframe()
+    df = pd.concat(partes, ignore_index=True)
+    for col in (*COLUMNAS_FECHA, *COLUMNAS_PESO):
+        if col in df.columns and len({parte[col].dtype for parte in partes}) > 1:
+            df[col] = _columna_tipada(col, [valor for parte in partes for valor in _texto(col, parte[col])])
+    return compactar(df)
+
+def a_registros(df):
+    # Registros de texto como los de la extracción (para guardarlos fuera del DataFrame)
+    return pd.DataFrame({col: _texto(col, df[col]) for col in df.columns}).to_dict('records')
@@ -0,0 +1,51 @@
+import json
+import time
+import uuid
+import logging
+from contextlib import contextmanager
+from datetime import datetime
+
+# Registro de tiempos por etapa y por archivo de una conciliación. Cada evento se emite además
+# como una línea JSON en el logger "rendimiento" para el agregador de logs.
+logger = logging.getLogger("rendimiento")
+
+def configurar_log_estructurado(nivel=logging.INFO):
+    # Envía las líneas JSON a stderr sin prefijos; idempotente para los reruns de Streamlit
+    if not logger.handlers:
+        manejador = logging.StreamHandler()
+        manejador.setFormatter(logging.Formatter("%(message)s"))
+        logger.addHandler(manejador)
+        logger.propagate = False
+    logger.setLevel(nivel)
+
+class RegistroRendimiento:
+    def __init__(self):
+        self.id_lote = uuid.uuid4().hex[:12]
+        self.inicio = datetime.now().isoformat(timespec="seconds")
+        self.etapas = []
+        self.archivos = []
+
+    def _emitir(self, evento, datos):
+        logger.info(json.dumps({"evento": evento, "lote": self.id_lote, **datos}, ensure_ascii=False, default=str))
+
+    @contextmanager
+    def etapa(self, nombre, **datos):
+        # Mide el tiempo de pared del bloque; `datos` puede completarse dentro del with.
+        # Una etapa con el mismo nombre reemplaza a la anterior (p. ej. al repetirse en cada rerun).
+        inicio = time.perf_counter()
+        try:
+            yield datos
+        finally:
+            entrada = {"etapa": nombre, "segundos": round(time.perf_counter() - inicio, 6), **datos}
+            self.etapas = [e for e in self.etapas if e["etapa"] != nombre] + [entrada]
+            self._emitir("etapa", entrada)
+
+    def registrar_archivo(self, metricas):
+        self.archivos.append(metricas)
+        self._emitir("archivo", metricas)
+
+    def como_dict(self):
+        return {"lote": self.id_lote, "inicio": self.inicio, "etapas": self.etapas, "archivos": self.archivos}
+
+    def como_json(self):
+        return json.dumps(self.como_dict(), ensure_ascii=False, indent=2, default=str)
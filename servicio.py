@@ -0,0 +1,337 @@
+# Servicio HTTP local para que otros sistemas (ERP, estación de escaneo) envíen guías y
+# formularios sin pasar por la página de Streamlit.
+#
+#   python servicio.py --puerto 8502 --workers 4
+#
+#   POST /extraer/guias        registros de las guías (sin duplicados por Tracking)
+#   POST /extraer/formularios  registros de los formularios
+#   POST /conciliar            conciliación completa, igual que la app y cli.py
+#   GET  /salud                estado del pool de procesos y de la cola
+#
+# Los PDF (sueltos o en ZIP) llegan como multipart/form-data (campos "guias" y "formularios") o
+# como JSON con rutas, directorios o patrones glob {"guias": [...], "formularios": [...]}
+# relativos a --raiz y siempre dentro de ella. Un pool de procesos arrancado al inicio lee todos los PDF, así que
+# ninguna petición paga el arranque de procesos ni la importación de pdfplumber. Como mucho
+# --concurrencia peticiones se leen y procesan a la vez (el cuerpo se lee ya con turno, así que
+# la memoria también queda acotada); las demás esperan en cola (hasta --cola y --espera
+# segundos) sin haber leído el cuerpo y si no hay sitio reciben 503.
+import io
+import os
+import re
+import sys
+import json
+import logging
+import argparse
+import itertools
+import threading
+import contextlib
+from http import HTTPStatus
+from email.parser import BytesParser
+from email.policy import HTTP
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from extraccion import WORKERS_POR_DEFECTO, procesar_archivos_guias_pdf, procesar_formularios_pdf
+from conciliacion import conciliar
+from cache_extraccion import DIRECTORIO_POR_DEFECTO, CacheExtraccion
+from rendimiento import RegistroRendimiento, configurar_log_estructurado
+from registros import a_registros, formularios_a_dataframe
+from cli import resolver_entradas
+
+logger = logging.getLogger(__name__)
+
+PUERTO_POR_DEFECTO = 8502
+CONCURRENCIA_POR_DEFECTO = 2
+COLA_POR_DEFECTO = 16
+ESPERA_POR_DEFECTO = 300
+MAX_MB_PETICION = 512
+CAMPOS_ARCHIVOS = ("guias", "formularios")
+TIPOS_ZIP = ("application/zip", "application/x-zip-compressed")
+RE_COMODIN = re.compile(r"[*?[]")
+
+class ErrorPeticion(Exception):
+    def __init__(self, estado, mensaje, errores=()):
+        super().__init__(mensaje)
+        self.estado = estado
+        self.errores = list(errores)
+
+def _calentar(_):
+    # Se ejecuta una vez en cada proceso del pool para que ya esté arrancado con pdfplumber importado
+    import pdfplumber
+    return os.getpid()
+
+# --- LECTURA DE PETICIONES ---
+def leer_multipart(tipo, cuerpo):
+    mensaje = BytesParser(policy=HTTP).parsebytes(f"Content-Type: {tipo}\r\n\r\n".encode("latin-1") + cuerpo)
+    if not mensaje.is_multipart(): raise ErrorPeticion(HTTPStatus.BAD_REQUEST, "Cuerpo multipart inválido")
+    archivos = {campo: [] for campo in CAMPOS_ARCHIVOS}
+    for parte in mensaje.iter_parts():
+        campo = parte.get_param("name", header="content-disposition")
+        if campo not in archivos: continue
+        contenido = io.BytesIO(parte.get_payload(decode=True) or b"")
+        extension = ".zip" if parte.get_content_type() in TIPOS_ZIP else ".pdf"
+        contenido.name = parte.get_filename() or f"{campo}_{len(archivos[campo]) + 1}{extension}"
+        archivos[campo].append(contenido)
+    return archivos
+
+def _patron_dentro(raiz, patron):
+    # El prefijo sin comodines debe quedar dentro de la raíz y tras el primer comodín no se admite '..'
+    componentes = os.path.join(raiz, patron).split(os.sep)
+    fijos = list(itertools.takewhile(lambda componente: not RE_COMODIN.search(componente), componentes))
+    return ".." not in componentes[len(fijos):] and _dentro(raiz, os.sep.join(fijos) or os.sep)
+
+def _dentro(raiz, ruta):
+    return os.path.commonpath([raiz, os.path.realpath(ruta)]) == raiz
+
+def leer_rutas(cuerpo, raiz):
+    try:
+        datos = json.loads(cuerpo or b"{}")
+    except ValueError as e:
+        raise ErrorPeticion(HTTPStatus.BAD_REQUEST, f"JSON inválido: {e}")
+    if not isinstance(datos, dict): raise ErrorPeticion(HTTPStatus.BAD_REQUEST, "Se esperaba un objeto JSON")
+    archivos = {}
+    for campo in CAMPOS_ARCHIVOS:
+        patrones = datos.get(campo) or []
+        if isinstance(patrones, str): patrones = [patrones]
+        patrones = [str(p) for p in patrones]
+        # El prefijo sin comodines se valida antes de resolver nada, y las respuestas nunca incluyen
+        # las rutas encontradas: el servicio no debe servir para listar directorios fuera de la raíz
+        for patron in patrones:
+            if not _patron_dentro(raiz, patron):
+                raise ErrorPeticion(HTTPStatus.FORBIDDEN, f"Ruta fuera de la raíz del servicio: {patron}")
+        rutas = resolver_entradas([os.path.join(raiz, p) for p in patrones])
+        # Un enlace simbólico dentro de la raíz puede apuntar fuera de ella
+        if not all(_dentro(raiz, r) for r in rutas):
+            raise ErrorPeticion(HTTPStatus.FORBIDDEN, "Alguna ruta resuelta queda fuera de la raíz del servicio")
+        archivos[campo] = rutas
+    return archivos
+
+def como_json(df):
+    # Mismo texto que los registros de la extracción: fechas AAAA-MM-DD, pesos con 2 decimales
+    return [{col: valor.item() if hasattr(valor, "item") else valor for col, valor in registro.items()}
+            for registro in a_registros(df)]
+
+# --- SERVICIO ---
+class ServicioConciliacion:
+    def __init__(self, workers=WORKERS_POR_DEFECTO, concurrencia=CONCURRENCIA_POR_DEFECTO, cola=COLA_POR_DEFECTO,
+                 espera=ESPERA_POR_DEFECTO, cache=None, raiz=".", por_paginas=False, dirigido=True):
+        self.workers, self.concurrencia, self.cola, self.espera = workers, concurrencia, cola, espera
+        self.cache = cache
+        self.raiz = os.path.realpath(raiz)
+        self.por_paginas, self.dirigido = por_paginas, dirigido
+        self.en_curso = self.en_cola = self.atendidas = self.rechazadas = 0
+        self._pool = None
+        self._lock = threading.Lock()
+        self._lock_pool = threading.Lock()
+        self._cupos = threading.BoundedSemaphore(concurrencia)
+
+    def iniciar(self):
+        self._crear_pool()
+        return self
+
+    def cerrar(self):
+        if self._pool is not None: self._pool.shutdown(cancel_futures=True)
+
+    def _crear_pool(self):
+        pool = ProcessPoolExecutor(max_workers=self.workers)
+        # Una tarea por proceso a la vez: el pool arranca todos sus procesos antes de la primera petición
+        pids = set(pool.map(_calentar, range(self.workers)))
+        logger.info(f"Pool de extracción listo: {len(pids)} procesos")
+        self._pool = pool
+
+    def _con_pool(self, funcion):
+        # Si un proceso del pool muere (p. ej. un PDF que agota la memoria) se recrea el pool y se reintenta una vez
+        pool = self._pool
+        try:
+            return funcion(pool)
+        except BrokenProcessPool:
+            with self._lock_pool:
+                if self._pool is pool:
+                    logger.warning("Pool de extracción roto; se vuelve a crear")
+                    self._crear_pool()
+            return funcion(self._pool)
+
+    def _esperar_cupo(self):
+        with self._lock:
+            if self.en_cola >= self.cola:
+                self.rechazadas += 1
+                raise ErrorPeticion(HTTPStatus.SERVICE_UNAVAILABLE, "Cola llena, inténtalo más tarde")
+            self.en_cola += 1
+        obtenido = self._cupos.acquire(timeout=self.espera)
+        with self._lock:
+            self.en_cola -= 1
+            if not obtenido: self.rechazadas += 1
+        if not obtenido: raise ErrorPeticion(HTTPStatus.SERVICE_UNAVAILABLE, "Tiempo de espera en cola agotado")
+
+    @contextlib.contextmanager
+    def turno(self):
+        # Con un cupo libre se entra directamente; si no, se espera en la cola
+        if not self._cupos.acquire(blocking=False): self._esperar_cupo()
+        with self._lock: self.en_curso += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.en_curso -= 1
+                self.atendidas += 1
+            self._cupos.release()
+
+    def estado(self):
+        with self._lock:
+            return {
+                "estado": "ok",
+                "workers": self.workers,
+                "concurrencia": self.concurrencia,
+                "en_curso": self.en_curso,
+                "en_cola": self.en_cola,
+                "atendidas": self.atendidas,
+                "rechazadas": self.rechazadas,
+                "cache": self.cache.estadisticas() if self.cache is not None else None,
+            }
+
+    # --- OPERACIONES ---
+    def _guias(self, archivos, errores, rendimiento):
+        with rendimiento.etapa("extraccion_guias", archivos=len(archivos)) as datos:
+            df_guias = self._con_pool(lambda pool: procesar_archivos_guias_pdf(
+                archivos, errores.append, self.workers, self.cache, self.por_paginas, rendimiento, pool=pool
+            ))
+            datos["registros"] = len(df_guias)
+        return df_guias
+
+    def _formularios(self, archivos, errores, rendimiento):
+        with rendimiento.etapa("extraccion_formularios", archivos=len(archivos)) as datos:
+            registros = self._con_pool(lambda pool: procesar_formularios_pdf(
+                archivos, errores.append, self.workers, self.cache, self.dirigido, rendimiento, pool=pool
+            ))
+            datos["registros"] = len(registros)
+        return registros
+
+    def extraer_guias(self, archivos, rendimiento):
+        errores = []
+        df_guias = self._guias(archivos["guias"], errores, rendimiento)
+        return {"registros": como_json(df_guias), "errores": errores}
+
+    def extraer_formularios(self, archivos, rendimiento):
+        errores = []
+        return {"registros": self._formularios(archivos["formularios"], errores, rendimiento), "errores": errores}
+
+    def conciliar(self, archivos, rendimiento):
+        errores = []
+        df_guias = self._guias(archivos["guias"], errores, rendimiento)
+        df_formularios = formularios_a_dataframe(self._formularios(archivos["formularios"], errores, rendimiento))
+        if df_guias.empty or df_formularios.empty:
+            raise ErrorPeticion(HTTPStatus.UNPROCESSABLE_ENTITY, "No se pudieron extraer datos suficientes para comparar",
+                                errores)
+        with rendimiento.etapa("conciliacion", registros=len(df_guias) + len(df_formularios)):
+            df_conciliado = conciliar(df_guias, df_formularios)
+        conteo_estados = df_conciliado['Estado_Conciliacion'].value_counts()
+        return {
+            "resultados": como_json(df_conciliado),
+            "resumen": {estado: int(cantidad) for estado, cantidad in conteo_estados.items() if cantidad > 0},
+            "errores": errores,
+        }
+
+RUTAS = {
+    "/extraer/guias": ServicioConciliacion.extraer_guias,
+    "/extraer/formularios": ServicioConciliacion.extraer_formularios,
+    "/conciliar": ServicioConciliacion.conciliar,
+}
+
+class ManejadorPeticiones(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def _responder(self, estado, cuerpo):
+        datos = json.dumps(cuerpo, ensure_ascii=False).encode("utf-8")
+        self.send_response(estado)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(datos)))
+        if estado == HTTPStatus.SERVICE_UNAVAILABLE: self.send_header("Retry-After", "5")
+        self.end_headers()
+        self.wfile.write(datos)
+
+    def _longitud(self):
+        longitud = int(self.headers.get("Content-Length") or 0)
+        if longitud > MAX_MB_PETICION * 1024 * 1024:
+            raise ErrorPeticion(HTTPStatus.REQUEST_ENTITY_TOO_LARGE, f"La petición supera {MAX_MB_PETICION} MB")
+        return longitud
+
+    def _leer_archivos(self, longitud):
+        cuerpo = self.rfile.read(longitud)
+        tipo = self.headers.get("Content-Type", "")
+        if tipo.startswith("multipart/form-data"): return leer_multipart(tipo, cuerpo)
+        if tipo.startswith("application/json") or not tipo: return leer_rutas(cuerpo, self.server.servicio.raiz)
+        raise ErrorPeticion(HTTPStatus.UNSUPPORTED_MEDIA_TYPE, f"Content-Type no soportado: {tipo}")
+
+    def do_GET(self):
+        if self.path.split("?")[0] == "/salud": self._responder(HTTPStatus.OK, self.server.servicio.estado())
+        else: self._responder(HTTPStatus.NOT_FOUND, {"error": f"Ruta no encontrada: {self.path}"})
+
+    def do_POST(self):
+        servicio = self.server.servicio
+        operacion = RUTAS.get(self.path.split("?")[0])
+        rendimiento = RegistroRendimiento()
+        # Si se responde sin haber leído el cuerpo (404, 413, 503) la conexión no se puede reutilizar
+        cerrar, self.close_connection = self.close_connection, True
+        try:
+            if operacion is None: raise ErrorPeticion(HTTPStatus.NOT_FOUND, f"Ruta no encontrada: {self.path}")
+            longitud = self._longitud()
+            with servicio.turno():
+                archivos = self._leer_archivos(longitud)
+                self.close_connection = cerrar
+                cuerpo = operacion(servicio, archivos, rendimiento)
+            self._responder(HTTPStatus.OK, {**cuerpo, "lote": rendimiento.id_lote})
+        except ErrorPeticion as e:
+            self._responder(e.estado, {"error": str(e), "errores": e.errores, "lote": rendimiento.id_lote})
+        except Exception as e:
+            logger.exception("Error atendiendo %s", self.path)
+            self._responder(HTTPStatus.INTERNAL_SERVER_ERROR, {"error": f"Error en procesamiento: {e}",
+                                                               "lote": rendimiento.id_lote})
+
+    def log_message(self, formato, *args):
+        logger.info("%s %s", self.address_string(), formato % args)
+
+def crear_servidor(servicio, host="127.0.0.1", puerto=PUERTO_POR_DEFECTO):
+    servidor = ThreadingHTTPServer((host, puerto), ManejadorPeticiones)
+    servidor.daemon_threads = True
+    servidor.servicio = servicio
+    return servidor
+
+def crear_parser():
+    parser = argparse.ArgumentParser(description="Servicio HTTP local de extracción y conciliación")
+    parser.add_argument("--host", default="127.0.0.1", help="Interfaz de escucha (por defecto solo local)")
+    parser.add_argument("--puerto", type=int, default=PUERTO_POR_DEFECTO)
+    parser.add_argument("--workers", type=int, default=WORKERS_POR_DEFECTO, help="Procesos de extracción del pool")
+    parser.add_argument("--concurrencia", type=int, default=CONCURRENCIA_POR_DEFECTO,
+                        help="Peticiones procesadas a la vez; las demás esperan en cola")
+    parser.add_argument("--cola", type=int, default=COLA_POR_DEFECTO, help="Peticiones en espera antes de responder 503")
+    parser.add_argument("--espera", type=float, default=ESPERA_POR_DEFECTO, help="Segundos máximos de espera en cola")
+    parser.add_argument("--raiz", default=".", help="Directorio desde el que se aceptan rutas en las peticiones JSON")
+    parser.add_argument("--por-paginas", action="store_true", help="Leer las guías página a página (PDF muy grandes)")
+    parser.add_argument("--formularios-completos", action="store_true",
+                        help="Extraer todas las páginas de los formularios en lugar de solo las relevantes")
+    parser.add_argument("--sin-cache", action="store_true", help="No usar la caché de extracción")
+    parser.add_argument("--cache-dir", default=DIRECTORIO_POR_DEFECTO, help="Directorio de la caché de extracción")
+    return parser
+
+def main(argv=None):
+    args = crear_parser().parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    configurar_log_estructurado()
+    servicio = ServicioConciliacion(
+        max(1, args.workers), max(1, args.concurrencia), max(0, args.cola), args.espera,
+        None if args.sin_cache else CacheExtraccion(args.cache_dir), args.raiz, args.por_paginas,
+        not args.formularios_completos
+    ).iniciar()
+    servidor = crear_servidor(servicio, args.host, args.puerto)
+    logger.info(f"Escuchando en http://{args.host}:{servidor.server_port}")
+    try:
+        servidor.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        servidor.server_close()
+        servicio.cerrar()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
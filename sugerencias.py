@@ -0,0 +1,143 @@
+from array import array
+from collections import Counter
+import numpy as np
+import pandas as pd
+from conciliacion import ESTADO_SOLO_FMM, ESTADO_SOLO_GUIA
+
+# Posibles parejas para los trackings sin coincidencia exacta ("❌ SOLO EN GUÍA" frente a
+# "❌ SOLO EN FMM"): un dígito mal leído, uno de más o de menos, dos cifras traspuestas.
+# Índice de borrados simétrico: dos trackings a distancia de edición <= k comparten al menos
+# una variante con hasta k caracteres borrados, así que los candidatos salen de un join por
+# variante y solo ellos se verifican con la distancia. La búsqueda va por niveles:
+#   - distancia <= 1: sustitución = mismo borrado en la misma posición en los dos lados;
+#     inserción o borrado = la clave de un lado es una variante del otro. Salen solo las
+#     parejas a distancia 1 y se comprueban en tiempo lineal.
+#   - distancia <= k: solo para los trackings que aún no tienen `por_tracking` parejas; las
+#     variantes que comparten muchas claves (trackings consecutivos) se descartan.
+# Se calcula aparte y bajo demanda; la conciliación exacta no cambia.
+DISTANCIA_MAXIMA = 2
+SUGERENCIAS_POR_TRACKING = 3
+# Claves más cortas comparten demasiadas variantes y no dan sugerencias útiles
+LONGITUD_MINIMA = 6
+# Una variante con k borrados que comparten más claves de un mismo lado no distingue entre ellas
+# (p. ej. trackings consecutivos sin dos de sus últimas cifras) y haría cuadrático el join
+MAXIMO_POR_VARIANTE = 32
+COLUMNAS_SUGERENCIA = ['Tracking_Guia', 'Tracking_FMM', 'Distancia', 'Similitud',
+                       'Fecha_Guia', 'Fecha_FMM', 'Pais_Normalizado_Guia', 'Pais_Normalizado_FMM']
+
+def normalizar_tracking(tracking):
+    return "".join(c for c in str(tracking).upper() if c.isalnum())
+
+def variantes_por_borrado(clave, k):
+    variantes = frontera = {clave}
+    for _ in range(k):
+        frontera = {v[:i] + v[i + 1:] for v in frontera for i in range(len(v))}
+        variantes = variantes | frontera
+    return variantes
+
+def variantes_por_posicion(clave):
+    return {(clave[:i] + clave[i + 1:], i) for i in range(len(clave))}
+
+def _a_un_cambio(a, b):
+    # Cierto si a y b (distintas) difieren en una sustitución, inserción o borrado
+    if len(a) < len(b): a, b = b, a
+    if len(a) - len(b) > 1: return False
+    i = next((i for i, (x, y) in enumerate(zip(a, b)) if x != y), len(b))
+    return a[i + 1:] == (b[i + 1:] if len(a) == len(b) else b[i:])
+
+def distancia_edicion(a, b, maximo):
+    # Levenshtein por filas; devuelve maximo + 1 en cuanto se sabe que lo supera
+    if abs(len(a) - len(b)) > maximo: return maximo + 1
+    anterior = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        actual = [i]
+        for j, cb in enumerate(b, 1):
+            actual.append(min(anterior[j] + 1, actual[j - 1] + 1, anterior[j - 1] + (ca != cb)))
+        if min(actual) > maximo: return maximo + 1
+        anterior = actual
+    return min(anterior[-1], maximo + 1)
+
+def _indice_variantes(claves, posiciones, variantes, maximo=None):
+    # (hash de la variante, posición de la clave) en arrays compactos, sin un dict por variante
+    hashes, numeros = array('q'), array('q')
+    for posicion in posiciones:
+        for variante in variantes(claves[posicion]):
+            hashes.append(hash(variante))
+            numeros.append(posicion)
+    indice = pd.DataFrame({'variante': np.frombuffer(hashes, dtype=np.int64),
+                           'posicion': np.frombuffer(numeros, dtype=np.int64)})
+    if maximo is None: return indice
+    return indice[indice.groupby('variante')['posicion'].transform('size') <= maximo]
+
+def _cruzar(indice_guia, indice_fmm):
+    return indice_guia.merge(indice_fmm, on='variante', suffixes=('_guia', '_fmm'))[['posicion_guia', 'posicion_fmm']]
+
+def _candidatos_un_cambio(claves_guia, claves_fmm):
+    guias, formularios = range(len(claves_guia)), range(len(claves_fmm))
+    propia = lambda clave: (clave,)
+    borrados = lambda clave: {variante for variante, _ in variantes_por_posicion(clave)}
+    propias_guia = _indice_variantes(claves_guia, guias, propia)
+    propias_fmm = _indice_variantes(claves_fmm, formularios, propia)
+    candidatos = pd.concat([
+        _cruzar(_indice_variantes(claves_guia, guias, variantes_por_posicion),
+                _indice_variantes(claves_fmm, formularios, variantes_por_posicion)),
+        _cruzar(propias_guia, _indice_variantes(claves_fmm, formularios, borrados)),
+        _cruzar(_indice_variantes(claves_guia, guias, borrados), propias_fmm),
+    ]).drop_duplicates()
+    return zip(candidatos['posicion_guia'].tolist(), candidatos['posicion_fmm'].tolist())
+
+def _candidatos(claves_guia, claves_fmm, k, pendientes):
+    candidatos = _cruzar(
+        _indice_variantes(claves_guia, pendientes, lambda clave: variantes_por_borrado(clave, k), MAXIMO_POR_VARIANTE),
+        _indice_variantes(claves_fmm, range(len(claves_fmm)), lambda clave: variantes_por_borrado(clave, k),
+                          MAXIMO_POR_VARIANTE),
+    ).drop_duplicates()
+    return zip(candidatos['posicion_guia'].tolist(), candidatos['posicion_fmm'].tolist())
+
+def _huerfanos(df_conciliado, estado, columnas):
+    # Primera fila de cada tracking huérfano con su clave normalizada
+    filas = df_conciliado.loc[df_conciliado['Estado_Conciliacion'] == estado, ['Tracking', *columnas]]
+    filas = filas.drop_duplicates(subset=['Tracking']).reset_index(drop=True)
+    filas['Clave'] = filas['Tracking'].map(normalizar_tracking)
+    return filas[filas['Clave'].str.len() >= LONGITUD_MINIMA].reset_index(drop=True)
+
+def sugerir_pares(df_conciliado, distancia_maxima=DISTANCIA_MAXIMA, por_tracking=SUGERENCIAS_POR_TRACKING):
+    # Parejas (guía, FMM) ordenadas por distancia; como mucho `por_tracking` por tracking de guía
+    guias = _huerfanos(df_conciliado, ESTADO_SOLO_GUIA, ['Fecha_Guia', 'Pais_Normalizado_Guia'])
+    formularios = _huerfanos(df_conciliado, ESTADO_SOLO_FMM, ['Fecha_FMM', 'Pais_Normalizado_FMM'])
+    if guias.empty or formularios.empty: return pd.DataFrame(columns=COLUMNAS_SUGERENCIA)
+
+    claves_guia, claves_fmm = guias['Clave'].tolist(), formularios['Clave'].tolist()
+    def similitud(i, j, distancia):
+        return 1 - distancia / max(len(claves_guia[i]), len(claves_fmm[j]))
+
+    pares, vistos = [], set()
+    for i, j in _candidatos_un_cambio(claves_guia, claves_fmm):
+        vistos.add((i, j))
+        distancia = 0 if claves_guia[i] == claves_fmm[j] else 1
+        if distancia <= distancia_maxima and (distancia == 0 or _a_un_cambio(claves_guia[i], claves_fmm[j])):
+            pares.append((i, j, distancia, similitud(i, j, distancia)))
+    # Con `por_tracking` parejas a distancia <= 1, las de distancia mayor no entrarían
+    cercanas = Counter(i for i, _, _, _ in pares)
+    pendientes = [i for i in range(len(claves_guia)) if cercanas[i] < por_tracking]
+    if distancia_maxima > 1 and pendientes:
+        for i, j in _candidatos(claves_guia, claves_fmm, distancia_maxima, pendientes):
+            if (i, j) in vistos: continue
+            distancia = distancia_edicion(claves_guia[i], claves_fmm[j], distancia_maxima)
+            if 1 < distancia <= distancia_maxima:
+                pares.append((i, j, distancia, similitud(i, j, distancia)))
+    if not pares: return pd.DataFrame(columns=COLUMNAS_SUGERENCIA)
+
+    pares = pd.DataFrame(pares, columns=['posicion_guia', 'posicion_fmm', 'Distancia', 'Similitud'])
+    pares = pares.sort_values(['Distancia', 'Similitud', 'posicion_guia', 'posicion_fmm'],
+                              ascending=[True, False, True, True], kind='stable')
+    pares = pares.groupby('posicion_guia', sort=False).head(por_tracking)
+    sugerencias = pd.concat([
+        guias.drop(columns='Clave').iloc[pares['posicion_guia']].reset_index(drop=True)
+            .rename(columns={'Tracking': 'Tracking_Guia'}),
+        formularios.drop(columns='Clave').iloc[pares['posicion_fmm']].reset_index(drop=True)
+            .rename(columns={'Tracking': 'Tracking_FMM'}),
+        pares[['Distancia', 'Similitud']].reset_index(drop=True),
+    ], axis=1)
+    sugerencias.index += 1
+    return sugerencias[COLUMNAS_SUGERENCIA]
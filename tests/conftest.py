@@ -0,0 +1,67 @@
+import io
+import os
+import sys
+import zipfile
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# --- PDF DE PRUEBA ---
+# PDF de texto mínimo (Helvetica, una línea por renglón) para no depender de un generador
+def pdf_texto(paginas):
+    objetos = ["<< /Type /Catalog /Pages 2 0 R >>", None,
+               "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>"]
+    hojas = []
+    for lineas in paginas:
+        texto = "".join(f"({l.replace(chr(92), chr(92) * 2).replace('(', chr(92) + '(').replace(')', chr(92) + ')')}) '"
+                        for l in lineas)
+        flujo = f"BT /F1 10 Tf 14 TL 30 770 Td {texto} ET".encode("cp1252")
+        objetos.append(b"<< /Length %d >>\nstream\n" % len(flujo) + flujo + b"\nendstream")
+        objetos.append(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Contents {len(objetos)} 0 R "
+                       f"/Resources << /Font << /F1 3 0 R >> >> >>")
+        hojas.append(f"{len(objetos)} 0 R")
+    objetos[1] = f"<< /Type /Pages /Kids [{' '.join(hojas)}] /Count {len(hojas)} >>"
+    salida, posiciones = io.BytesIO(b"%PDF-1.4\n"), []
+    salida.seek(0, io.SEEK_END)
+    for n, objeto in enumerate(objetos, 1):
+        posiciones.append(salida.tell())
+        salida.write(f"{n} 0 obj\n".encode() + (objeto if isinstance(objeto, bytes) else objeto.encode("cp1252"))
+                     + b"\nendobj\n")
+    inicio_xref = salida.tell()
+    salida.write(f"xref\n0 {len(objetos) + 1}\n0000000000 65535 f \n".encode())
+    salida.write("".join(f"{p:010d} 00000 n \n" for p in posiciones).encode())
+    salida.write(f"trailer\n<< /Size {len(objetos) + 1} /Root 1 0 R >>\nstartxref\n{inicio_xref}\n%%EOF\n".encode())
+    return salida.getvalue()
+
+def guia_fedex(i):
+    t = f"7712{i:08d}"
+    return ["ORIGIN ID:ABCA (555) 555-5555", f"SHIP DATE: {10 + i % 18}MAR24", "SOLIDEO S.A.S.",
+            f"TRK# {t[:4]} {t[4:8]} {t[8:]}", "INV: ZFFV1001", f"PN: {1 + i % 30},5", f"FMM: {123456 if i % 4 else 100000}",
+            "(US) FEDEX"]
+
+def formulario(trackings, fmm=123456):
+    lineas = [f"FORMULARIO No. No. {fmm}", "1. USUARIO: SOLIDEO S.A.S.", "22. País Destino: 249 UNITED STATES OF AMERICA",
+              "DETALLE DE LOS ANEXOS", "6 FACTURA COMERCIAL ZFFV1001 2024/03/05"]
+    lineas += [f"127 GUIAS DE TRAFICO POSTAL {t[:4]} {t[4:8]} {t[8:]} 2024/03/{10 + int(t[-4:]) % 18}" for t in trackings]
+    return [lineas]
+
+def subido(contenido, nombre):
+    # Como un UploadedFile de Streamlit: buffer con nombre
+    archivo = io.BytesIO(contenido)
+    archivo.name = nombre
+    return archivo
+
+def zip_de(miembros, nombre):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as zf:
+        for nombre_miembro, contenido in miembros.items(): zf.writestr(nombre_miembro, contenido)
+    return subido(buffer.getvalue(), nombre)
+
+@pytest.fixture
+def pdfs():
+    return {
+        "guias_a": pdf_texto([guia_fedex(i) for i in range(12)]),
+        "guias_b": pdf_texto([guia_fedex(i) for i in range(12, 20)]),
+        "form_1": pdf_texto(formulario([f"7712{i:08d}" for i in range(0, 16, 2)])),
+        "form_2": pdf_texto(formulario([f"7712{i:08d}" for i in range(3, 24, 3)], 777)),
+    }
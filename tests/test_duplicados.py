@@ -0,0 +1,44 @@
+import time
+import cli
+from trabajos import SesionConciliacion
+from conftest import subido, zip_de
+
+def conciliar_cli(tmp_path, guias, formularios, nombre):
+    salida = tmp_path / f"{nombre}.csv"
+    assert cli.main(["--guias", *map(str, guias), "--formularios", *map(str, formularios), "--salida", str(salida),
+                     "--sin-cache", "--workers", "1"]) != cli.SALIDA_ERROR
+    return salida.read_text(encoding="utf-8-sig")
+
+def conciliar_app(tmp_path, sesion, guias, formularios, guias_quitadas=(), formularios_quitados=(), nombre="app"):
+    trabajo = sesion.lanzar({r.name: subido(r.read_bytes(), r.name) for r in guias},
+                            {r.name: subido(r.read_bytes(), r.name) for r in formularios},
+                            guias_quitadas, formularios_quitados, formularios_dirigido=True)
+    while trabajo.activo: time.sleep(0.01)
+    assert not trabajo.errores
+    salida = tmp_path / f"{nombre}.csv"
+    cli.guardar_resultados(sesion.conciliacion.resultados, str(salida))
+    return salida.read_text(encoding="utf-8-sig")
+
+def test_duplicados_app_igual_que_cli(tmp_path, pdfs):
+    # Un formulario, un ZIP que lo repite y una copia suelta: el contenido cuenta una sola vez
+    rutas = {
+        "g.pdf": pdfs["guias_a"], "g.zip": zip_de({"b.pdf": pdfs["guias_b"], "a.pdf": pdfs["guias_a"]}, "g.zip").getvalue(),
+        "f1.pdf": pdfs["form_1"], "f.zip": zip_de({"f1.pdf": pdfs["form_1"], "f2.pdf": pdfs["form_2"]}, "f.zip").getvalue(),
+        "copia.pdf": pdfs["form_1"],
+    }
+    for nombre, contenido in rutas.items(): (tmp_path / nombre).write_bytes(contenido)
+    guias = [tmp_path / "g.pdf", tmp_path / "g.zip"]
+    formularios = [tmp_path / "f1.pdf", tmp_path / "f.zip", tmp_path / "copia.pdf"]
+    sesion = SesionConciliacion()
+    assert conciliar_app(tmp_path, sesion, guias, formularios) == conciliar_cli(tmp_path, guias, formularios, "todo")
+    assert "✅ OK" in conciliar_cli(tmp_path, guias, formularios, "todo")
+
+    # Quitar el original: las filas pasan a la siguiente copia (ZIP y PDF suelto)
+    quitar = conciliar_app(tmp_path, sesion, [], [], ["g.pdf"], ["f1.pdf"], nombre="quitar")
+    assert quitar == conciliar_cli(tmp_path, guias[1:], formularios[1:], "quitar")
+    quitar = conciliar_app(tmp_path, sesion, [], [], [], ["f.zip"], nombre="quitar_zip")
+    assert quitar == conciliar_cli(tmp_path, guias[1:], formularios[2:], "quitar_zip")
+
+    # Volver a cargar el original en otro trabajo no lo cuenta dos veces
+    otra_vez = conciliar_app(tmp_path, sesion, [], [tmp_path / "f1.pdf"], nombre="otra_vez")
+    assert otra_vez == conciliar_cli(tmp_path, guias[1:], formularios[2:], "otra_vez")
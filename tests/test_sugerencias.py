@@ -0,0 +1,55 @@
+import random
+import time
+import pandas as pd
+from conciliacion import ESTADO_SOLO_FMM, ESTADO_SOLO_GUIA
+from sugerencias import distancia_edicion, sugerir_pares
+
+def huerfanos(guias, formularios):
+    return pd.DataFrame({
+        "Tracking": guias + formularios,
+        "Estado_Conciliacion": [ESTADO_SOLO_GUIA] * len(guias) + [ESTADO_SOLO_FMM] * len(formularios),
+        "Fecha_Guia": "", "Fecha_FMM": "", "Pais_Normalizado_Guia": "", "Pais_Normalizado_FMM": "",
+    })
+
+def levenshtein(a, b):
+    fila = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        diagonal, fila[0] = fila[0], i
+        for j, cb in enumerate(b, 1):
+            diagonal, fila[j] = fila[j], min(fila[j] + 1, fila[j - 1] + 1, diagonal + (ca != cb))
+    return fila[-1]
+
+def test_distancia_edicion_acotada():
+    azar = random.Random(3)
+    for _ in range(2000):
+        a, b = ("".join(azar.choice("0123") for _ in range(azar.randint(0, 8))) for _ in range(2))
+        maximo = azar.randint(0, 3)
+        assert distancia_edicion(a, b, maximo) == min(levenshtein(a, b), maximo + 1)
+
+def test_sugerencias_exactas_en_claves_aleatorias():
+    azar = random.Random(7)
+    def mutar(t):
+        i = azar.randrange(len(t))
+        return azar.choice([t[:i] + azar.choice("0123456789") + t[i + 1:], t[:i] + t[i + 1:],
+                            t[:i] + azar.choice("0123456789") + t[i:]])
+    for _ in range(20):
+        guias = list({"".join(azar.choice("0123456789") for _ in range(azar.choice((10, 12)))) for _ in range(50)})
+        formularios = list({mutar(mutar(t)) if azar.random() < .5 else mutar(t) for t in guias})
+        sugerencias = sugerir_pares(huerfanos(guias, formularios), 2, 1000)
+        esperadas = {(a, b, levenshtein(a, b)) for a in guias for b in formularios if levenshtein(a, b) <= 2}
+        assert set(zip(sugerencias["Tracking_Guia"], sugerencias["Tracking_FMM"], sugerencias["Distancia"])) == esperadas
+
+def test_sugerencias_consecutivas_escalan():
+    # Trackings consecutivos (pares en guías, impares en FMM) comparten muchas variantes con dos borrados
+    def medir(n):
+        df = huerfanos([f"7700000{2 * i:05d}" for i in range(n)], [f"7700000{2 * i + 1:05d}" for i in range(n)])
+        inicio = time.perf_counter()
+        sugerencias = sugerir_pares(df)
+        return time.perf_counter() - inicio, sugerencias
+    medir(500)
+    segundos, sugerencias = medir(2000)
+    segundos_4x, sugerencias_4x = medir(8000)
+    assert len(sugerencias_4x) == 3 * 8000 and (sugerencias_4x["Distancia"] == 1).all()
+    assert sugerencias_4x.groupby("Tracking_Guia").size().eq(3).all()
+    # Cuadrático serían ~16 veces más
+    assert segundos_4x < 8 * segundos
@@ -0,0 +1,174 @@
+import time
+import uuid
+import threading
+from rendimiento import RegistroRendimiento
+
+# Conciliación en segundo plano: un hilo extrae los archivos nuevos, informa del progreso por
+# archivo y puede cancelarse. Los archivos ya terminados se aplican a la conciliación aunque
+# el trabajo se cancele. Las sesiones viven en el proceso del servidor, así que sobreviven a
+# los reruns y a recargar el navegador (se recuperan por su id). El motor de extracción y de
+# conciliación (pdfplumber, pandas) se importa con el primer trabajo, no al abrir la app.
+EN_CURSO = "en curso"
+CANCELANDO = "cancelando"
+CANCELADO = "cancelado"
+TERMINADO = "terminado"
+FALLIDO = "fallido"
+
+# Horas sin actividad tras las que se descarta una sesión sin trabajo en curso
+HORAS_INACTIVIDAD = 12
+
+class TrabajoConciliacion:
+    def __init__(self, conciliacion, guias, formularios, guias_quitadas=(), formularios_quitados=(), workers=1,
+                 cache=None, por_paginas=False, formularios_dirigido=False, almacen=None):
+        # guias / formularios: {id_archivo: archivo} con los archivos a extraer
+        self.id = uuid.uuid4().hex[:12]
+        self.conciliacion = conciliacion
+        self.guias, self.formularios = dict(guias), dict(formularios)
+        self.guias_quitadas, self.formularios_quitados = list(guias_quitadas), list(formularios_quitados)
+        self.workers, self.cache, self.almacen = workers, cache, almacen
+        self.por_paginas, self.formularios_dirigido = por_paginas, formularios_dirigido
+        self.rendimiento = RegistroRendimiento()
+        self.estado = EN_CURSO
+        self.errores = []
+        self.total = len(self.guias) + len(self.formularios)
+        self.completados = 0
+        self.registros = 0
+        self.ultimo_archivo = ""
+        self.inicio = time.monotonic()
+        self.fin = None
+        self._lock = threading.Lock()
+        self._cancelar = threading.Event()
+        self._hilo = threading.Thread(target=self._ejecutar, name=f"conciliacion-{self.id}", daemon=True)
+
+    def iniciar(self):
+        self._hilo.start()
+        return self
+
+    def cancelar(self):
+        with self._lock:
+            if self.activo:
+                self._cancelar.set()
+                self.estado = CANCELANDO
+
+    @property
+    def activo(self):
+        return self.estado in (EN_CURSO, CANCELANDO)
+
+    def _archivo_terminado(self, metricas):
+        with self._lock:
+            self.completados += 1
+            self.registros += metricas.get("registros", 0)
+            self.ultimo_archivo = metricas.get("archivo", "")
+
+    def _archivos_expandidos(self, entradas, pdfs):
+        # Los ZIP cuentan en el progreso por sus PDF, y los PDF repetidos no cuentan
+        with self._lock:
+            self.total += pdfs - entradas
+
+    def progreso(self):
+        # Instantánea para la interfaz: fracción, archivos por segundo y segundos restantes estimados
+        with self._lock:
+            completados, registros, ultimo_archivo = self.completados, self.registros, self.ultimo_archivo
+            total = self.total
+        transcurrido = (self.fin or time.monotonic()) - self.inicio
+        velocidad = completados / transcurrido if transcurrido > 0 else 0.0
+        restantes = total - completados
+        return {
+            "estado": self.estado,
+            "completados": completados,
+            "total": total,
+            "fraccion": completados / total if total else 1.0,
+            "registros": registros,
+            "ultimo_archivo": ultimo_archivo,
+            "segundos": transcurrido,
+            "archivos_por_segundo": velocidad,
+            "eta_segundos": restantes / velocidad if velocidad > 0 and self.activo else None,
+        }
+
+    def _extraer(self, extractor, archivos, opcion, etapa):
+        ids = list(archivos)
+        if self._cancelar.is_set(): return []
+        with self.rendimiento.etapa(etapa, archivos=len(ids)):
+            por_archivo = extractor([archivos[i] for i in ids], self.errores.append, self.workers, self.cache, opcion,
+                                    self.rendimiento, self._archivo_terminado, self._cancelar.is_set,
+                                    expandido=lambda pdfs: self._archivos_expandidos(len(ids), pdfs), partes=True)
+        # Solo los archivos terminados, como (registros, partes); los cancelados se vuelven a extraer en el
+        # próximo trabajo
+        return [(i, registros) for i, registros in zip(ids, por_archivo) if registros is not None]
+
+    def _ejecutar(self):
+        try:
+            from extraccion import extraer_formularios_por_archivo, extraer_guias_por_archivo
+            guias = self._extraer(extraer_guias_por_archivo, self.guias, self.por_paginas, "extraccion_guias")
+            formularios = self._extraer(extraer_formularios_por_archivo, self.formularios, self.formularios_dirigido,
+                                        "extraccion_formularios")
+            if self.almacen is not None:
+                with self.rendimiento.etapa("almacen_guardar"):
+                    self.almacen.guardar([r for _, (registros, _) in guias for r in registros],
+                                         [r for _, (registros, _) in formularios for r in registros])
+            with self.rendimiento.etapa("conciliacion_incremental") as datos:
+                datos["trackings_recalculados"] = self.conciliacion.aplicar(
+                    guias, self.guias_quitadas, formularios, self.formularios_quitados
+                )
+            estado = CANCELADO if self._cancelar.is_set() else TERMINADO
+        except Exception as e:
+            self.errores.append(f"Error en procesamiento: {e}")
+            estado = FALLIDO
+        with self._lock:
+            # Los archivos cargados (buffers de Streamlit) no se retienen mientras la sesión siga registrada
+            self.guias, self.formularios = {}, {}
+            self.fin = time.monotonic()
+            self.estado = estado
+
+class SesionConciliacion:
+    # Conciliación incremental de una pestaña del navegador y su último trabajo
+    def __init__(self):
+        self._conciliacion = None
+        self.trabajo = None
+        self.ultimo_acceso = time.monotonic()
+
+    @property
+    def iniciada(self):
+        return self._conciliacion is not None
+
+    @property
+    def conciliacion(self):
+        if self._conciliacion is None:
+            from conciliacion_incremental import ConciliacionIncremental
+            self._conciliacion = ConciliacionIncremental()
+        return self._conciliacion
+
+    @property
+    def ocupada(self):
+        return self.trabajo is not None and self.trabajo.activo
+
+    def lanzar(self, *args, **kwargs):
+        if self.ocupada: raise RuntimeError("Ya hay un procesamiento en curso")
+        self.trabajo = TrabajoConciliacion(self.conciliacion, *args, **kwargs).iniciar()
+        return self.trabajo
+
+class RegistroSesiones:
+    def __init__(self, horas_inactividad=HORAS_INACTIVIDAD):
+        self.horas_inactividad = horas_inactividad
+        self._sesiones = {}
+        self._lock = threading.Lock()
+
+    def obtener(self, id_sesion):
+        with self._lock:
+            self._descartar_inactivas()
+            if id_sesion not in self._sesiones: self._sesiones[id_sesion] = SesionConciliacion()
+            sesion = self._sesiones[id_sesion]
+            sesion.ultimo_acceso = time.monotonic()
+            return sesion
+
+    def reiniciar(self, id_sesion):
+        with self._lock:
+            anterior = self._sesiones.get(id_sesion)
+            if anterior is not None and anterior.ocupada: anterior.trabajo.cancelar()
+            sesion = self._sesiones[id_sesion] = SesionConciliacion()
+            return sesion
+
+    def _descartar_inactivas(self):
+        limite = time.monotonic() - self.horas_inactividad * 3600
+        for id_sesion in [i for i, s in self._sesiones.items() if s.ultimo_acceso < limite and not s.ocupada]:
+            del self._sesiones[id_sesion]
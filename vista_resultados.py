@@ -0,0 +1,80 @@
+import numpy as np
+from esquema import COLUMNAS_DIFERENCIA
+from sugerencias import normalizar_tracking
+
+# Vista paginada de los resultados: los filtros se resuelven en el servidor sobre un índice
+# calculado una vez por versión de resultados y a la interfaz solo llega la página visible.
+#   - por estado: posiciones de las filas agrupadas por código de Estado_Conciliacion
+#   - por campo con diferencias: matriz booleana de las columnas Dif_*
+#   - por tracking: claves normalizadas ordenadas; un prefijo es un rango (búsqueda binaria)
+# Las posiciones filtradas se devuelven en el orden original de las filas.
+TAMANOS_PAGINA = (50, 100, 250, 500)
+COLUMNAS_VISTA = [
+    'Tracking', 'Fecha_Guia', 'Fecha_FMM',
+    'Pais_Normalizado_Guia', 'Pais_Normalizado_FMM',
+    'Peso_Neto_Guia', 'FMM_Guia', 'FMM_Formulario',
+    'Facturas_Guia', 'Facturas_FMM', 'Estado_Conciliacion'
+]
+NOMBRES_VISTA = {
+    'Pais_Normalizado_Guia': 'País_Guia',
+    'Pais_Normalizado_FMM': 'País_FMM',
+    'FMM_Guia': 'FMM_Guía',
+}
+
+class IndiceResultados:
+    def __init__(self, df):
+        self.df = df
+        self.total = len(df)
+        estados = df['Estado_Conciliacion']
+        if estados.dtype != 'category': estados = estados.astype('category')
+        codigos = estados.cat.codes.to_numpy()
+        self.estados = list(estados.cat.categories)
+        # Filas de cada estado contiguas (orden estable): las del código c están en _por_estado[_inicio[c]:_inicio[c + 1]]
+        self.conteos = np.bincount(codigos[codigos >= 0], minlength=len(self.estados))
+        self._por_estado = np.argsort(codigos, kind='stable')
+        self._inicio = np.concatenate(([0], np.cumsum(self.conteos))) + int((codigos < 0).sum())
+        self.columnas_diferencia = [col for col in COLUMNAS_DIFERENCIA if col in df.columns]
+        self._diferencias = df[self.columnas_diferencia].to_numpy(dtype=bool) if self.columnas_diferencia else None
+        claves = np.array([normalizar_tracking(t) for t in df['Tracking'].tolist()], dtype=str)
+        self._por_clave = np.argsort(claves, kind='stable')
+        self._claves = claves[self._por_clave]
+
+    def conteo_estados(self):
+        # Filas por estado, sin los estados de la categoría que no tienen filas
+        return {estado: int(n) for estado, n in zip(self.estados, self.conteos) if n}
+
+    def buscar_tracking(self, texto):
+        # Posiciones (ordenadas) de los trackings que empiezan por `texto`, sin distinguir espacios ni guiones
+        prefijo = normalizar_tracking(texto)
+        if not prefijo: return np.arange(self.total)
+        desde = np.searchsorted(self._claves, prefijo, side='left')
+        hasta = np.searchsorted(self._claves, prefijo + '\U0010ffff', side='left')
+        return np.sort(self._por_clave[desde:hasta])
+
+    def filtrar(self, estados=(), columnas_diferencia=(), tracking=""):
+        posiciones = None
+        codigos = [self.estados.index(e) for e in estados if e in self.estados]
+        if estados:
+            posiciones = np.sort(np.concatenate(
+                [self._por_estado[self._inicio[c]:self._inicio[c + 1]] for c in codigos] or [np.array([], dtype=np.intp)]
+            ))
+        if tracking and normalizar_tracking(tracking):
+            encontrados = self.buscar_tracking(tracking)
+            posiciones = encontrados if posiciones is None else np.intersect1d(posiciones, encontrados, assume_unique=True)
+        if posiciones is None: posiciones = np.arange(self.total)
+        indices = [self.columnas_diferencia.index(c) for c in columnas_diferencia if c in self.columnas_diferencia]
+        if indices and len(posiciones):
+            posiciones = posiciones[self._diferencias[np.ix_(posiciones, indices)].any(axis=1)]
+        return posiciones
+
+    def vista(self, posiciones):
+        # Filas indicadas con las columnas y nombres de la tabla de la app
+        columnas = [col for col in COLUMNAS_VISTA if col in self.df.columns]
+        return self.df.iloc[posiciones][columnas].rename(columns=NOMBRES_VISTA)
+
+    def pagina(self, posiciones, numero, tamano):
+        inicio = (numero - 1) * tamano
+        return self.vista(posiciones[inicio:inicio + tamano])
+
+def numero_paginas(filas, tamano):
+    return max(1, -(-filas // tamano))